@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import argparse
+
+# Only the processing and export modules are imported, so sessions can be exported on a machine without a display
+from classes import Session, PageProvider, Processor, TOOLS
+import exporter
+import timing
+from timing import span
+
+def export_session(_id, directory, mode='raster', workers=None, encoding=None, incremental=False):
+    # Exports one stored session to <directory>/session-<id>.pdf, returns the number of pages and the output path
+    stored = Session.load(_id)
+    if stored == None:
+        raise ValueError(f'Session "{_id}" does not exist')
+
+    output = os.path.join(directory, f'session-{_id}.pdf')
+    history = stored["data"]
+    workers = workers or os.cpu_count() or 1
+
+    if mode == 'vector':
+        exporter.export_vector(stored["file"], history, TOOLS, output)
+        return (len(history), output)
+
+    pages = PageProvider(stored["file"])
+    processor = Processor(pages)
+
+    try:
+        # Pages the session has no row for, such as ones added to the file later, are exported without annotations
+        history = history + [[]] * max(0, len(pages) - len(history))
+
+        if incremental:
+            exporter.export_incremental(processor, history, TOOLS, output=output, workers=workers, lock=processor.lock, encoding=encoding)
+        elif workers > 1:
+            exporter.export_parallel(processor, history, TOOLS, output=output, workers=workers, lock=processor.lock, encoding=encoding)
+        else:
+            exporter.export_serial(processor, history, TOOLS, output=output, encoding=encoding)
+
+        return (len(pages), output)
+    finally:
+        processor.close()
+        pages.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Export stored sessions to PDF without opening the editor')
+    parser.add_argument('sessions', nargs='*', type=int, help='ids of the sessions to export')
+    parser.add_argument('--all', action='store_true', help='export every stored session')
+    parser.add_argument('--output-dir', default='./exported', help='directory the PDFs are written to (default: %(default)s)')
+    parser.add_argument('--mode', choices=['raster', 'vector'], default='raster', help="'raster' rebuilds the pages from their extracted ink, 'vector' annotates the original document")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processes pages are rendered in, 1 renders them in this process (default: %(default)s)')
+    parser.add_argument('--encoding', choices=exporter.PageEncoding.FORMATS, default='png', help='how raster pages store their ink layer (default: %(default)s)')
+    parser.add_argument('--level', type=int, choices=range(10), metavar='0-9', help='PNG compression level of the page images')
+    parser.add_argument('--quality', type=int, default=85, help='JPEG quality of the jpeg and bilevel encodings (default: %(default)s)')
+    parser.add_argument('--colors', type=int, default=16, help='palette size of the palette encoding (default: %(default)s)')
+    parser.add_argument('--incremental', action='store_true', help='only rewrite the pages that changed since the last export of the session')
+    parser.add_argument('--trace', metavar='PATH', help='write a Chrome trace of the export stages to PATH')
+
+    arguments = parser.parse_args()
+
+    encoding = exporter.PageEncoding(arguments.encoding, level=arguments.level, quality=arguments.quality, colors=arguments.colors)
+
+    if arguments.trace != None: timing.enable(arguments.trace)
+
+    if arguments.all:
+        ids = list(map(lambda e: e["id"], Session.list()))
+    else:
+        ids = arguments.sessions
+
+    if len(ids) == 0:
+        parser.error('no sessions given, pass their ids or --all')
+
+    os.makedirs(arguments.output_dir, exist_ok=True)
+
+    failed = 0
+    start = time.perf_counter()
+
+    for _id in ids:
+        began = time.perf_counter()
+
+        try:
+            with span('export', session=_id, mode=arguments.mode, workers=arguments.workers):
+                pages, output = export_session(_id, arguments.output_dir, arguments.mode, arguments.workers, encoding, arguments.incremental)
+        except Exception as error:
+            print(f'Session {_id}: failed, {error}')
+            failed += 1
+            continue
+
+        elapsed = time.perf_counter() - began
+        print(f'Session {_id}: exported {pages} page(s) in {elapsed:.2f}s ({elapsed / max(pages, 1) * 1000:.0f} ms per page), {os.path.getsize(output) / 1024 / 1024:.2f} MB')
+
+    print(f'Exported {len(ids) - failed} of {len(ids)} session(s) in {time.perf_counter() - start:.2f}s')
+
+    return 1 if failed != 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,346 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import fitz
+
+from classes import Session, PageProvider, Processor, RasterCache, Pencil, TOOLS
+from renderer import CanvasRenderer
+from store import SessionStore, Autosaver
+from stroke import Stroke, decode_data
+import exporter
+
+# Benchmarks of the editor's hot paths, every result carries ops/sec, p50/p99 latency and the peak memory
+# traced during one extra run, and the whole run is written out as JSON so runs can be compared
+
+PDF = './file.pdf'
+SESSIONS = './sessions.json'
+
+def measure(name, op, iterations, setup=None, size=None, **params):
+    # size is called after the runs for the number of bytes the benchmark produced, if it produces any
+    # op and setup are called with the iteration number, only op is timed
+    timings = []
+
+    for i in range(iterations):
+        if setup != None: setup(i)
+
+        start = time.perf_counter()
+        op(i)
+        timings.append(time.perf_counter() - start)
+
+    # Tracing allocations slows everything down, so the peak is taken from one more run that is not timed
+    if setup != None: setup(iterations)
+
+    tracemalloc.start()
+    op(iterations)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = np.array(timings)
+
+    result = {
+        "name": name,
+        "params": params,
+        "iterations": iterations,
+        "ops_per_sec": iterations / timings.sum() if timings.sum() != 0 else None,
+        "p50_ms": float(np.percentile(timings, 50)) * 1000,
+        "p99_ms": float(np.percentile(timings, 99)) * 1000,
+        "peak_bytes": peak,
+    }
+
+    if size != None:
+        result["output_bytes"] = size()
+
+    print(f'{name:<16} {json.dumps(params):<48} {result["ops_per_sec"] or 0:>10.1f} ops/s  p50 {result["p50_ms"]:>9.3f} ms  p99 {result["p99_ms"]:>9.3f} ms  peak {peak / 1024 / 1024:>8.2f} MB' + (f'  output {result["output_bytes"] / 1024 / 1024:>8.2f} MB' if size != None else ''))
+
+    return result
+
+class NullCanvas:
+    # Stands in for the Tk canvas, the tools only create, move and delete items on it
+    def __init__(self):
+        self.items = 0
+
+    def create_line(self, *args, **kwargs):
+        self.items += 1
+        return self.items
+
+    create_rectangle = create_line
+
+    def coords(self, *args): pass
+    def delete(self, *args): pass
+    def addtag_withtag(self, *args): pass
+    def scale(self, *args): pass
+    def move(self, *args): pass
+
+def load_samples(path=SESSIONS):
+    # Annotations of the bundled sessions, the synthetic pages are made of copies of them
+    with open(path, "r") as file:
+        sessions = json.loads(file.read())
+
+    items = [item for session in sessions for page in session["data"] for item in decode_data(page)]
+
+    strokes = list(map(lambda e: e["info"], filter(lambda e: e["type"] == "pencil" and len(e["info"]) > 1, items)))
+    highlights = list(map(lambda e: e["info"], filter(lambda e: e["type"] == "highlight", items)))
+
+    return strokes, highlights
+
+def synthetic_page(strokes, highlights, segments, rng):
+    # Copies of the sample strokes moved to random places until the page has the given number of segments,
+    # with a highlight for every ~50 strokes
+    data = []
+    count = 0
+
+    while count < segments:
+        stroke = rng.choice(strokes)
+        offset = np.array([rng.uniform(-200, 200), rng.uniform(-300, 300)], dtype=np.float32)
+
+        data.append({ "type": "pencil", "info": Stroke(stroke.points + offset) })
+        count += len(stroke) - 1
+
+        if rng.random() < 0.02:
+            data.append({ "type": "highlight", "info": list(rng.choice(highlights)) })
+
+    return data
+
+def synthetic_pdf(pages, path):
+    # The bundled document repeated until it has the given number of pages
+    source = fitz.open(PDF)
+    doc = fitz.open()
+
+    while doc.page_count < pages:
+        doc.insert_pdf(source, to_page=min(source.page_count, pages - doc.page_count) - 1)
+
+    doc.save(path)
+    doc.close()
+    source.close()
+
+def bench_get_image(config, rng, directory):
+    pages = PageProvider(PDF)
+    processor = Processor(pages, raster=RasterCache(os.path.join(directory, 'raster')))
+
+    # Every call is a cache miss, the page is rasterized and its ink extracted
+    def setup(i):
+        processor.cache.clear()
+        processor.raster.clear()
+        pages.pages.clear()
+
+    results = []
+    fit = round(pages.fit_dpi(0, 721, 1020))
+
+    for dpi in sorted(set([fit, 100, 150, pages.dpi])):
+        results.append(measure('get_image', lambda i: processor.get_image(i % len(pages), dpi), config.iterations, setup, dpi=dpi))
+
+    # A page processed in an earlier run, mapped from the disk cache
+    def setup(i):
+        processor.cache.clear()
+        pages.pages.clear()
+
+    processor.get_image(0, fit)
+    results.append(measure('get_image', lambda i: processor.get_image(0, fit), config.iterations * 10, setup, dpi=fit, cached='disk'))
+
+    # A page turn onto a prefetched page
+    processor.get_image(0, fit)
+    results.append(measure('get_image', lambda i: processor.get_image(0, fit), config.iterations * 10, dpi=fit, cached='memory'))
+
+    processor.close()
+    pages.close()
+
+    return results
+
+def bench_export(config, rng, directory):
+    strokes, highlights = load_samples()
+
+    path = os.path.join(directory, 'bench.pdf')
+    output = os.path.join(directory, 'exported.pdf')
+    synthetic_pdf(config.pages, path)
+
+    history = [synthetic_page(strokes, highlights, 500, rng) for _ in range(config.pages)]
+
+    pages = PageProvider(path)
+    processor = Processor(pages, raster=RasterCache(os.path.join(directory, 'raster')))
+
+    def setup(i):
+        processor.cache.clear()
+        processor.raster.clear()
+        pages.pages.clear()
+
+    iterations = max(1, config.iterations // 10)
+
+    results = [
+        measure('export', lambda i: exporter.export_serial(processor, history, TOOLS, output), iterations, setup, mode='serial', pages=config.pages),
+        measure('export', lambda i: exporter.export_parallel(processor, history, TOOLS, output, workers=config.workers, lock=processor.lock), iterations, setup, mode='parallel', pages=config.pages, workers=config.workers),
+        measure('export', lambda i: exporter.export_vector(path, history, TOOLS, output), iterations, mode='vector', pages=config.pages),
+    ]
+
+    processor.close()
+    pages.close()
+
+    return results
+
+def bench_encoding(config, rng, directory):
+    # Encode time of one page and size of the exported document for every page encoding
+    pages = PageProvider(PDF)
+    processor = Processor(pages, raster=RasterCache(os.path.join(directory, 'raster')))
+
+    images = list(map(lambda i: processor.get_image(i), range(len(pages))))
+    history = [[] for _ in range(len(pages))]
+    output = os.path.join(directory, 'encoded.pdf')
+
+    results = []
+
+    for format, level in [('png', None), ('png', 9), ('bilevel', None), ('jpeg', None), ('palette', None)]:
+        encoding = exporter.PageEncoding(format, level=level)
+
+        # The size is that of the whole document, exported with the default save options
+        def size():
+            exporter.export_serial(processor, history, TOOLS, output, encoding=encoding)
+            return os.path.getsize(output)
+
+        results.append(measure('encode', lambda i: encoding.encode(images[i % len(images)]), config.iterations, size=size, format=format, level=level))
+
+    processor.close()
+    pages.close()
+
+    return results
+
+def bench_change_data(config, rng, directory):
+    # An edit is marked by change_data and written by the next flush, both are timed, for stores of growing size
+    strokes, highlights = load_samples()
+    results = []
+
+    for sessions in config.sessions:
+        store = SessionStore(os.path.join(directory, f'sessions-{sessions}.db'), legacy=None)
+
+        for _ in range(sessions):
+            _id = store.add(PDF, 9)
+            store.set_pages([(_id, page, synthetic_page(strokes, highlights, 200, rng)) for page in range(9)])
+
+        Session.store = store
+        Session.autosaver = Autosaver(store, interval=3600)
+
+        session = Session(PDF, _id=rng.randrange(sessions))
+        data = synthetic_page(strokes, highlights, 200, rng)
+
+        def op(i):
+            data.append({ "type": "highlight", "info": list(rng.choice(highlights)) })
+            session.change_data(i % 9, data)
+            Session.flush()
+
+        results.append(measure('change_data', op, config.iterations * 10, sessions=sessions))
+
+        Session.close()
+        Session.store = None
+        store.close()
+
+    return results
+
+def bench_eraser(config, rng):
+    # One eraser motion event over a page, the strokes it finds are blurred but never removed
+    strokes, highlights = load_samples()
+    results = []
+
+    for segments in config.segments:
+        data = synthetic_page(strokes, highlights, segments, rng)
+
+        pencil = Pencil(NullCanvas(), lambda: None)
+        pencil.index.rebuild(data)
+
+        positions = [(rng.uniform(0, 721), rng.uniform(0, 1020)) for _ in range(config.iterations * 10 + 1)]
+
+        def setup(i):
+            pencil.removing = []
+
+        results.append(measure('eraser', lambda i: pencil.on_move(*positions[i], data, right=True), len(positions) - 1, setup, segments=segments))
+
+    return results
+
+def bench_render(config, rng):
+    # A page redrawn from nothing, as on a page turn, and the number of canvas items it takes
+    strokes, highlights = load_samples()
+    results = []
+
+    for segments in config.segments:
+        data = synthetic_page(strokes, highlights, segments, rng)
+
+        canvas = NullCanvas()
+        renderer = CanvasRenderer(canvas, TOOLS)
+
+        def setup(i):
+            renderer.items = {}
+            canvas.items = 0
+
+        setup(0)
+        renderer.sync(data)
+
+        results.append(measure('render', lambda i: renderer.sync(data), config.iterations, setup, segments=segments, items=canvas.items))
+
+    return results
+
+def bench_simplify(config, rng):
+    # The stored strokes are raw pointer samples, the ones with the most points are simplified
+    strokes, _ = load_samples()
+    strokes = sorted(strokes, key=len, reverse=True)[:100]
+
+    pencil = Pencil(NullCanvas(), lambda: None)
+    points = list(map(lambda e: e.points.tolist(), strokes))
+
+    return [measure('simplify', lambda i: pencil.simplify(points[i % len(points)]), config.iterations * 10, points=int(np.mean(list(map(len, strokes)))))]
+
+BENCHMARKS = {
+    'get_image': bench_get_image,
+    'export': bench_export,
+    'encoding': bench_encoding,
+    'change_data': bench_change_data,
+    'eraser': lambda config, rng, directory: bench_eraser(config, rng),
+    'render': lambda config, rng, directory: bench_render(config, rng),
+    'simplify': lambda config, rng, directory: bench_simplify(config, rng),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the editor hot paths')
+    parser.add_argument('benchmarks', nargs='*', help=f'benchmarks to run, any of {", ".join(BENCHMARKS.keys())} (default: all)')
+    parser.add_argument('--output', default='bench.json', help='JSON file the results are written to (default: %(default)s)')
+    parser.add_argument('--iterations', type=int, default=20, help='base number of timed runs, fast benchmarks run ten times as many (default: %(default)s)')
+    parser.add_argument('--pages', type=int, default=9, help='pages of the exported document (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processes of the parallel export (default: %(default)s)')
+    parser.add_argument('--segments', type=int, nargs='+', default=[1000, 10000, 100000], help='segments on the page the eraser runs over')
+    parser.add_argument('--sessions', type=int, nargs='+', default=[10, 100, 1000], help='stored sessions for the change_data benchmark')
+    parser.add_argument('--seed', type=int, default=0)
+
+    config = parser.parse_args()
+
+    names = config.benchmarks or list(BENCHMARKS.keys())
+    for name in names:
+        if name not in BENCHMARKS: parser.error(f'unknown benchmark "{name}"')
+
+    rng = random.Random(config.seed)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            results += BENCHMARKS[name](config, rng, directory)
+
+    report = {
+        "created": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "fitz": fitz.VersionBind,
+        "config": { key: value for key, value in vars(config).items() if key != 'output' },
+        "results": results,
+    }
+
+    with open(config.output, "w") as file:
+        file.write(json.dumps(report, indent=4))
+
+    print(f'Wrote {len(results)} result(s) to "{config.output}"')
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,27 @@
+import os
 import json
+import hashlib
 import cv2 as cv
 import numpy as np
-import fitz, math
+import fitz, threading, queue
+from collections import OrderedDict
+
+from store import Session
+from stroke import Stroke, simplify, TOLERANCE
+from spatial import SpatialIndex
+from renderer import ViewTransform
+from timing import span
+from filecache import atomic_save, evict
 
 QUALITY = 1
 THRESHOLD = 150
+DPI = 200 # Same default resolution pdf2image rasterized at
+MODE = 'threshold' # How ink is told apart from paper, one of 'threshold', 'otsu' or 'adaptive'
+CACHE_BUDGET = 256 * 1024 * 1024 # Bytes of processed pages kept in memory, a 200 dpi A4 page is ~15 MB
+RASTER_CACHE = './.cache/raster' # Processed pages on disk, shared by every session and run on the same document
+RASTER_BUDGET = 1024 * 1024 * 1024 # Bytes of processed pages kept on disk
+RASTER_PRUNED = 0.9 # Fraction of the budget the disk cache is pruned down to, so not every write has to prune
+FRAME_INTERVAL = 16 # Milliseconds between redraws of the stroke being drawn, about one frame of a 60 Hz display
 
 def count_pdf(filename):
     pdf = fitz.open(filename)
@@ -13,167 +30,438 @@ def count_pdf(filename):
 
     return pages
 
-class Processor:
-    def __init__(self, images):
-        self.images = images
+def export_scale(width, height):
+    # Annotations are stored in the fitted canvas coordinates, this scales them onto a page of the given size
+    return 1 / min(721 / width, 1020 / height)
+
+def blend_state(page, mode):
+    # Name of an ExtGState in the page's resources that sets the blend mode, added on first use
+    # Resources a page inherits from its parents are copied onto it first, so setting the key keeps them
+    doc = page.parent
+    name = f'blend{mode}'
+
+    xref = page.xref
+    while doc.xref_get_key(xref, 'Resources')[0] == 'null' and doc.xref_get_key(xref, 'Parent')[0] == 'xref':
+        xref = int(doc.xref_get_key(xref, 'Parent')[1].split()[0])
+
+    kind, value = doc.xref_get_key(xref, 'Resources')
+    if xref != page.xref or kind == 'null':
+        doc.xref_set_key(page.xref, 'Resources', value if kind != 'null' else '<<>>')
+
+    def child(owner, path, key):
+        # Keys can only be set through direct dictionaries, an indirect one is followed to its own object
+        kind, value = doc.xref_get_key(owner, path)
+        if kind == 'xref': return (int(value.split()[0]), key)
+
+        return (owner, f'{path}/{key}')
+
+    owner, path = child(page.xref, 'Resources', 'ExtGState')
+    owner, path = child(owner, path, name)
+
+    if doc.xref_get_key(owner, path)[0] == 'null':
+        doc.xref_set_key(owner, path, f'<</Type/ExtGState/BM/{mode}>>')
+
+    return name
+
+def hash_file(filename, chunk=1024 * 1024):
+    # SHA-1 of the file's bytes, a document is recognized by its content wherever it is stored
+    digest = hashlib.sha1()
+
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(chunk), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+class PageProvider:
+    # Opens the document once and rasterizes pages only when they are asked for,
+    # the most recently used pages are kept around in a bounded LRU
+    def __init__(self, filename, dpi=DPI, capacity=4):
+        self.filename = filename
+        self.dpi = dpi
+        self.capacity = capacity
+        self.document = fitz.open(filename)
+        self.pages = OrderedDict()
+        self.hash = None
+
+        # The document is not thread safe and a page may be rasterizing on another thread, so the page sizes
+        # the editor asks for on every page turn and zoom are read once, here
+        self.rects = [page.rect for page in self.document]
 
-    def pil_to_cv(self, image):
-        cv_image = np.array(image) 
-        cv_image = cv_image[:, :, ::-1].copy() 
+    def get_hash(self):
+        # Content hash of the document, computed on first use
+        if self.hash == None:
+            self.hash = hash_file(self.filename)
 
-        return cv_image
+        return self.hash
 
-    def get_blank_transparent(self, shape):
-        b_channel = np.ones((shape[0], shape[1]), dtype=np.uint8) * 255
-        r_channel = np.ones((shape[0], shape[1]), dtype=np.uint8) * 255
-        g_channel = np.ones((shape[0], shape[1]), dtype=np.uint8) * 255
-        alpha_channel = np.ones((shape[0], shape[1]), dtype=np.uint8) * 0
+    def __len__(self):
+        return len(self.rects)
 
-        image = cv.merge((b_channel, g_channel, r_channel, alpha_channel))
+    def get_image(self, index, dpi=None):
+        # Without a resolution the page is rasterized at full resolution, as export needs it
+        key = (index, dpi or self.dpi)
+
+        if key in self.pages:
+            self.pages.move_to_end(key)
+            return self.pages[key]
+
+        image = self.rasterize(index, key[1])
+
+        self.pages[key] = image
+        if len(self.pages) > self.capacity:
+            self.pages.popitem(last=False)
 
         return image
 
-    def get_image(self, index):
-        image = self.pil_to_cv(self.images[index])
-        # image = self.images[index]
+    def fit_dpi(self, index, width, height):
+        # Resolution at which the page just fits into width x height pixels, pages are measured in points (1/72 inch)
+        rect = self.rects[index]
+
+        return min(width / rect.width, height / rect.height) * 72
+
+    def rasterize(self, index, dpi=None):
+        with span('rasterize', page=index, dpi=dpi or self.dpi):
+            pixmap = self.document[index].get_pixmap(dpi=dpi or self.dpi, alpha=False)
+
+        # The pixmap rows may be padded, so view the samples through the stride before dropping the padding
+        samples = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.stride)
+        samples = samples[:, :pixmap.width * pixmap.n].reshape(pixmap.height, pixmap.width, pixmap.n)
+
+        # The rest of the pipeline expects BGR, the same layout the pdf2image images were converted to
+        return cv.cvtColor(samples, cv.COLOR_RGB2BGR)
+
+    def close(self):
+        self.pages.clear()
+        self.document.close()
+
+class InkExtractor:
+    # Turns a BGR page into a BGRA page where the paper is transparent and the ink keeps its colour
+    # The grayscale and mask planes are scratch buffers that are reused for every page of the same size
+    def __init__(self, mode=MODE, threshold=THRESHOLD, quality=QUALITY, block=51, offset=15):
+        if mode not in ['threshold', 'otsu', 'adaptive']:
+            raise ValueError(f'Unknown ink extraction mode "{mode}"')
+
+        self.mode = mode
+        self.threshold = threshold
+        self.quality = quality
+
+        # Neighbourhood size and constant subtracted from the local mean in adaptive mode
+        self.block = block
+        self.offset = offset
+
+        self.buffers = {}
+
+    def buffer(self, name, shape):
+        buffer = self.buffers.get(name)
+
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.uint8)
+            self.buffers[name] = buffer
+
+        return buffer
+
+    def extract(self, image, out=None):
+        with span('extract', mode=self.mode):
+            return self.extract_ink(image, out)
+
+    def extract_ink(self, image, out=None):
+        if self.quality != 1:
+            (height, width, _) = image.shape
+            size = (int(height * self.quality), int(width * self.quality), 3)
+            image = cv.resize(image, (size[1], size[0]), dst=self.buffer('resized', size), interpolation=cv.INTER_AREA)
 
         (height, width, _) = image.shape
-        
-        # Resize image
-        image = cv.resize(image, (int(width * QUALITY), int(height * QUALITY)), interpolation=cv.INTER_AREA)
 
-        # Convert to grayscale
-        img_gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+        if out is None:
+            out = np.empty((height, width, 4), dtype=np.uint8)
+
+        gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY, dst=self.buffer('gray', (height, width)))
+        mask = self.buffer('mask', (height, width))
 
-        # Get all colored pixels as black pixels
-        _, thresh = cv.threshold(img_gray, THRESHOLD, 255, cv.THRESH_BINARY)
+        # Inverted thresholds, so ink becomes 255 and paper becomes 0 in a single pass
+        if self.mode == 'threshold':
+            cv.threshold(gray, self.threshold, 255, cv.THRESH_BINARY_INV, dst=mask)
+        elif self.mode == 'otsu':
+            cv.threshold(gray, 0, 255, cv.THRESH_BINARY_INV | cv.THRESH_OTSU, dst=mask)
+        else:
+            cv.adaptiveThreshold(gray, 255, cv.ADAPTIVE_THRESH_MEAN_C, cv.THRESH_BINARY_INV, self.block, self.offset, dst=mask)
 
-        # Invert to get all non-colored pixels as black pixels
-        invert_thresh = cv.bitwise_not(thresh)
+        # The colour channels are copied untouched and the mask becomes the alpha channel, which is what
+        # AND-ing the page with a white image carrying the mask as its alpha used to produce
+        cv.cvtColor(image, cv.COLOR_BGR2BGRA, dst=out)
+        out[:, :, 3] = mask
 
-        # Add alpha channel to original image
-        image = cv.cvtColor(image, cv.COLOR_BGR2BGRA)
+        return out
 
-        # Get blank white image, all pixels are (255, 255, 255, 0)
-        blank = self.get_blank_transparent(image.shape)
+    def extract_batch(self, images, out=None):
+        # Pages of the same size are written into one contiguous (N, height, width, 4) block
+        shapes = set(map(lambda e: e.shape, images))
 
-        # To the alpha channel of the blank image, we can assign the scalar values of the inverted threshold image
-        # The alpha channel has a 2d shape, so does the inverted threshold image, and we can treat the black pixels-
-        # in the inverted threshold image as transparent pixels, if we assign all of these to the blank image,
-        # the blank image will contain transparent white pixels where the black pixels would've been in the inverted
-        # threshold image, and opaque white pixels where the white pixels would've been in the inverted threshold image
-        blank[:, :, 3] = invert_thresh
+        if out is None and len(shapes) == 1:
+            (height, width, _) = images[0].shape
+            if self.quality != 1:
+                (height, width) = (int(height * self.quality), int(width * self.quality))
 
-        # Now, since all non-white pixels are now opaque, and white pixels are now transaprent, this is what would occur
-        # during a bitwise AND operation:
-        # If a pixel is non-white in the original image, it will remain opaque
-        # If a pixel is white in the original image, it will become transparent
-        return cv.bitwise_and(image, blank)
+            out = np.empty((len(images), height, width, 4), dtype=np.uint8)
 
-class Session:
-    @staticmethod
-    def get():
-        with open("./sessions.json", "r") as file:
-            return json.loads(file.read())
+        if out is None:
+            return list(map(lambda e: self.extract(e), images))
 
-    @staticmethod
-    def set(data):
-        with open('./sessions.json', "w") as file:
-            file.write(json.dumps(data))
+        for i in range(len(images)):
+            self.extract(images[i], out=out[i])
+
+        return out
+
+class PageCache:
+    # Processed pages keyed by (page, dpi, QUALITY, THRESHOLD), the least recently used pages are evicted
+    # once the total size of the cached images goes over the byte budget
+    def __init__(self, budget=CACHE_BUDGET):
+        self.budget = budget
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries: return None
+
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, image):
+        # Cached images are shared between callers, so nobody may modify them in place
+        image.flags.writeable = False
+
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key).nbytes
+
+            self.entries[key] = image
+            self.size += image.nbytes
+
+            # Always keep the newest entry, even if it alone is over the budget
+            while self.size > self.budget and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+class RasterCache:
+    # Processed pages on disk as .npy files named after the document's content hash, the page, the resolution and
+    # the ink extraction settings, so reopening a document, from any session or path, renders nothing
+    # Pages are loaded memory-mapped, reading a file marks it as used and the least recently used files are deleted
+    # once the cache is over its byte budget
+    # The size is counted as pages are written, the directory is only listed when the cache opens and when it prunes
+    def __init__(self, directory=RASTER_CACHE, budget=RASTER_BUDGET):
+        self.directory = directory
+        self.budget = budget
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.size = sum(map(lambda e: e[1], self.entries()))
 
     @staticmethod
-    def delete(index):
-        sessions = Session.get()
-        del sessions[index]
-        Session.set(sessions)
-    
-    def __init__(self, file=None, _id=None):
-        if _id != None:
-            self.id = _id
-            return
+    def key(document, index, dpi, extractor):
+        settings = [extractor.mode, extractor.threshold, extractor.quality, extractor.block, extractor.offset]
 
-        sessions = Session.get()
+        return hashlib.sha1(json.dumps([document, index, dpi, settings]).encode()).hexdigest()
 
-        self.id = self.acquire_id(sessions)
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.npy')
 
-        pages = count_pdf(file)
+    def get(self, key):
+        path = self.path(key)
 
-        sessions.append({
-            "id": self.id,
-            "file": file,
-            "data": [[]] * pages
-        })
+        try:
+            image = np.load(path, mmap_mode='r')
+            os.utime(path) # The modification time is when the page was last used
+        except (OSError, ValueError):
+            return None # Missing, or deleted by another process in the meantime
 
-        Session.set(sessions)
+        return image
 
-        print(f'Initialized session "{self.id}" on file "{file}" with {pages} page(s)')
+    def put(self, key, image):
+        # A page written again, by another process in the meantime, replaces the size it was counted with
+        path = self.path(key)
+        previous = os.path.getsize(path) if os.path.exists(path) else 0
 
+        atomic_save(path, lambda file: np.save(file, image))
 
-    def acquire_id(self, sessions):
-        _id = 0
-        if len(sessions) != 0:
-            numbers = list(map(lambda e: e["id"], sessions))
-            _id = list(sorted(numbers, reverse=True))[0] + 1
-        return _id
-            
-    def change_data(self, page, data):
-        sessions = Session.get()
+        self.size += os.path.getsize(path) - previous
+        if self.size > self.budget:
+            self.prune()
 
-        # print(sessions)
-        index = next((i for i, e in enumerate(sessions) if e["id"] == self.id), -1)
+    def entries(self):
+        # (modification time, size, path) of every cached page, least recently used first
+        entries = []
 
-        if index == -1:
-            print(f'Failed to update sessions of ID "{self.id}"')
-            return
-        
-        sessions[index]["data"][page] = data
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npy'): continue
 
-        Session.set(sessions)
+            path = os.path.join(self.directory, name)
+
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+        return sorted(entries)
+
+    def prune(self):
+        # The listing also picks up pages other processes wrote or deleted since the size was last counted
+        self.size = evict(self.entries(), self.budget * RASTER_PRUNED)
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        self.size = 0
+
+class Processor:
+    def __init__(self, pages, cache=None, raster=None):
+        self.pages = pages
+        self.cache = cache if cache != None else PageCache()
+        self.raster = raster if raster != None else RasterCache()
+        self.extractor = InkExtractor()
+
+        # The provider (and the fitz document behind it) is not thread safe, only one page is processed at a time
+        self.lock = threading.Lock()
+
+        # Neighbouring pages are processed in the background after every page turn
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self.prefetch_worker, daemon=True)
+        self.worker.start()
+
+    def get_image(self, index, dpi=None):
+        # Previews ask for the resolution they are displayed at, export leaves it out for the full resolution
+        # Only previews go to the disk cache, a whole document at export resolution would push them all out
+        persist = dpi != None
+        dpi = dpi or self.pages.dpi
+        key = (index, dpi, self.extractor.quality, self.extractor.threshold, self.extractor.mode)
+
+        image = self.cache.get(key)
+        if image is not None: return image
+
+        with self.lock:
+            # The prefetch worker may have finished this page while we were waiting for the lock
+            image = self.cache.get(key)
+            if image is not None: return image
+
+            # Pages processed before, in this run or an earlier one, are mapped from the disk cache
+            if persist:
+                stored = self.raster.key(self.pages.get_hash(), index, dpi, self.extractor)
+                image = self.raster.get(stored)
+
+            if image is None:
+                image = self.process(index, dpi)
+
+                if persist:
+                    self.raster.put(stored, image)
+
+        self.cache.put(key, image)
+
+        return image
+
+    def prefetch(self, index, dpi=None):
+        for neighbour in [index + 1, index - 1]:
+            if neighbour >= 0 and neighbour < len(self.pages):
+                self.queue.put((neighbour, dpi))
+
+    def prefetch_worker(self):
+        while True:
+            request = self.queue.get()
+            if request == None: return # Closed
+
+            index, dpi = request
+
+            try:
+                self.get_image(index, dpi)
+            except Exception as error:
+                print(f'Failed to prefetch page "{index}": {error}')
+
+    def process(self, index, dpi=None):
+        return self.extractor.extract(self.pages.get_image(index, dpi))
+
+    def close(self):
+        # Stops the prefetch worker and drops the cached pages, the provider is closed by its owner
+        # Pages waiting to be prefetched are skipped, the one being processed is finished first
+        while not self.queue.empty():
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+        self.queue.put(None)
+        self.worker.join()
+        self.cache.clear()
 
 class Tool:
-    def __init__(self, canvas, update):
+    def __init__(self, canvas, update, index=None, view=None):
         self.canvas = canvas
         self.update = update
 
+        # Spatial index of the annotations in the current page, kept in sync by the tools as they change the page
+        self.index = index if index != None else SpatialIndex()
+
+        # Tools receive positions in page units, the view maps them back onto the canvas for the items drawn while dragging
+        self.view = view if view != None else ViewTransform()
+
 class Highlighter(Tool):
-    def __init__(self, canvas, update):
-        super().__init__(canvas, update)
+    def __init__(self, canvas, update, index=None, view=None):
+        super().__init__(canvas, update, index, view)
 
         self.rectangle = None
         self.origin = [0, 0]
+        self.info = None
         self.name = "highlight"
         
     def on_press(self, x, y, right=False):
         if right: return
 
         self.rectangle = self.canvas.create_rectangle(0, 0, 0, 0, fill="", outline="red")
-        self.canvas.coords(self.rectangle, x, y, x, y)
+        self.canvas.coords(self.rectangle, *self.view.map([x, y, x, y]))
         self.origin = [x, y]
 
     def on_move(self, xm, ym, data, right=False):
         if right: return
 
         x, y = self.origin
-        self.canvas.coords(self.rectangle, min(xm, x), min(ym, y), max(xm, x), max(ym, y))
+        self.canvas.coords(self.rectangle, *self.view.map([min(xm, x), min(ym, y), max(xm, x), max(ym, y)]))
 
     def on_release(self, xm, ym, data, right=False):
         if not right:
             x, y = self.origin
-            self.canvas.coords(self.rectangle, min(xm, x), min(ym, y), max(xm, x), max(ym, y))
-            data.append({ "type": self.name, "info": self.get_info() })    
+            self.info = [float(min(xm, x)), float(min(ym, y)), float(max(xm, x)), float(max(ym, y))]
+            item = { "type": self.name, "info": self.get_info() }
+            data.add(item)
+            self.index.insert(item)
+
+            # The renderer draws the committed rectangle, the one used while dragging is not needed anymore
+            self.canvas.delete(self.rectangle)
+            self.rectangle = None
         else:
             # TODO: Make the eraser tool perform this, make a conditions dictionary as to indicate when an erase event would occur
             # Find the first item that is a highlight rectangle which also encompasses the current release mouse position
-            # The enumerated list is reversed to maintain layer order
-            result = next((item for item in reversed(list(enumerate(data))) if item[1]["type"] == self.name and self.inside_rect((xm, ym), item[1]["info"])), None)
-            index = result[0] if result != None else -1
+            # The index returns the candidates around the position bottom to top, so they are reversed to maintain layer order
+            result = next((item for item in reversed(self.index.query(xm, ym, _type=self.name)) if self.inside_rect((xm, ym), item["info"])), None)
 
-            if index == -1: return
-        
-            del data[index]
+            if result == None: return
+
+            data.remove([result])
+            self.index.remove(result)
 
     def get_info(self):
-        return self.canvas.coords(self.rectangle)
+        # Kept in page units, the canvas coordinates of the rectangle depend on the view
+        return self.info
 
     def inside_rect(self, point, rect):
         x0, y0, x1, y1 = rect
@@ -183,170 +471,163 @@ class Highlighter(Tool):
     @staticmethod
     def render(canvas, info):
         x0, y0, x1, y1 = info
-        canvas.create_rectangle(x0, y0, x1, y1, fill="yellow", outline="red")
+        return [canvas.create_rectangle(x0, y0, x1, y1, fill="yellow", outline="red")]
 
     @staticmethod
-    def export_render(engine, page, image, info):
-        (height, width, _) = image.shape
-
-        scale = 1 / min(721 / width, 1020 / height)
+    def style(info):
+        return None
 
-        x0, y0, x1, y1 = info
-        x0 *= scale
-        y0 *= scale
-        x1 *= scale
-        y1 *= scale
+    @staticmethod
+    def export_batch(engine, shape, infos, scale):
+        # Every rectangle is drawn into the shape and styled by a single finish
+        if len(infos) == 0: return
 
-        rect = engine.Rect(x0, y0, x1, y1)
+        for x0, y0, x1, y1 in infos:
+            shape.draw_rect(engine.Rect(x0 * scale, y0 * scale, x1 * scale, y1 * scale))
 
-        shape = page.new_shape()
-        shape.draw_rect(rect)
+        # Multiplied with what is already on the page, so the text and images under a highlight stay visible
+        shape.draw_cont = f'/{blend_state(shape.page, "Multiply")} gs\n' + shape.draw_cont
         shape.finish(width = 0.3, color = (1, 0, 0), fill = (1, 1, 0))
-        shape.commit()
 
 class Pencil(Tool):
-    def __init__(self, canvas, update):
-        super().__init__(canvas, update)
+    def __init__(self, canvas, update, index=None, view=None):
+        super().__init__(canvas, update, index, view)
 
         self.rectangle = None
         self.drawing = None
+        self.line = None # Canvas item of the stroke being drawn
+        self.coordinates = [] # Its canvas coordinates, flat, for the points drawn so far
+        self.frame = None # Pending redraw of the stroke, motion events in between are only buffered
         self.removing = []
+        self.tolerance = TOLERANCE
         self.name = "pencil"
         
     def on_press(self, x, y, right=False):
         if right: return
 
         self.drawing = [
-            [x, y, x, y, 1]
+            [x, y]
         ]
 
-        self.canvas.create_line(x, y, x, y, fill="black", width=1)
+        self.coordinates = self.view.map([x, y])
+        self.line = self.canvas.create_line(*self.coordinates, *self.coordinates, fill="black", width=1)
 
     def on_move(self, xm, ym, data, right=False):
         if right:
-            splines = list(filter(lambda e: e[1]["type"] == "pencil", list(enumerate(data))))
             offset = 10
 
-            indices = []
-            
-            for spline in splines:
-                for line in spline[1]["info"]:
-                    x0, y0, x1, y1, _ = line
-                    magnitude = math.sqrt((y1 - y0)**2 + (x1 - x0)**2)
-
-                    maximum = 2 * math.sqrt(offset**2 + (magnitude / 2)**2)
-                    mouse_dist = math.sqrt((ym - y0)**2 + (xm - x0)**2) + math.sqrt((ym - y1)**2 + (xm - x1)**2)
+            # Only the strokes registered around the pointer are tested
+            splines = self.index.query(xm, ym, radius=offset, _type=self.name)
+            removing = set(map(id, self.removing))
 
-                    if mouse_dist <= maximum:
-                        indices.append(spline[0])
-                        break
+            found = list(filter(lambda e: id(e) not in removing and e["info"].near(xm, ym, offset), splines))
 
-            old = self.removing.copy()
-            self.removing = self.removing + list(set(indices).difference(self.removing))
+            if len(found) != 0:
+                for spline in found:
+                    self.blur_spline(spline)
 
-            if len(old) != len(self.removing):
-                data[:] = list(map(lambda e: e[1] if e[0] not in self.removing else self.blur_spline(e[1]), list(enumerate(data))))
+                self.removing = self.removing + found
                 self.update()
 
             return
 
-        x0, y0, x1, y1, _ = self.drawing[-1]
+        self.drawing.append([xm, ym])
 
-        self.drawing.append([x1, y1, xm, ym, 1])
-        self.canvas.create_line(x1, y1, xm, ym, fill="black", width=1)
+        if self.frame == None:
+            self.frame = self.canvas.after(FRAME_INTERVAL, self.redraw)
 
-    def on_release(self, xm, ym, data, right=False):
-        if right:
-            data[:] = list(map(lambda e: e[1], filter(lambda e: e[0] not in self.removing, list(enumerate(data)))))
-            self.removing = []
-
-            return
+    def redraw(self):
+        # The stroke is one polyline, the points buffered since the last frame extend its coordinates at once
+        self.frame = None
+        if self.line == None: return
 
-        x0, y0, x1, y1, _ = self.drawing[-1]
-
-        self.drawing.append([x1, y1, xm, ym, 1])
-
-        self.canvas.create_line(x1, y1, xm, ym, fill="black", width=1)
-
-        self.drawing = self.simplify(self.drawing)
-        # self.simplify(self.drawing)
-        data.append({ "type": self.name, "info": self.get_info() })   
+        drawn = len(self.coordinates) // 2
+        self.coordinates += self.view.map([value for point in self.drawing[drawn:] for value in point])
 
-    def simplify(self, lines):
-        points = list(map(lambda e: [e[0], e[1]], lines))
-        print(points)
+        self.canvas.coords(self.line, *self.coordinates)
 
-        threshold = 1.5
-        previous_slope = None
+    def on_release(self, xm, ym, data, right=False):
+        if right:
+            # The strokes leave the page as one operation, unblurred so an undo brings them back as they were
+            for spline in self.removing:
+                spline["info"].flags &= ~Stroke.BLURRED
+                self.index.remove(spline)
 
-        indices = []
+            data.remove(self.removing)
 
-        for i in range(0, len(points) - 1):
-            slope = self.get_slope(points[i], points[i + 1])
+            self.removing = []
 
-            if previous_slope == None:
-                previous_slope = slope
-                continue            
-            
-            if previous_slope == 'vertical' or slope == 'vertical':
-                if previous_slope == slope:
-                    indices.append(i)
-            else:
-                if abs(slope - previous_slope) <= threshold:
-                    indices.append(i)
+            return
 
-            previous_slope = slope
+        self.drawing.append([xm, ym])
 
-        points = list(map(lambda e: e[1], filter(lambda e: e[0] not in indices, list(enumerate(points)))))
+        # The renderer draws the committed stroke, the line drawn while moving is not needed anymore
+        if self.frame != None:
+            self.canvas.after_cancel(self.frame)
+            self.frame = None
 
-        for i in range(0, len(points) - 1):
-            p1 = points[i]
-            p2 = points[i + 1]
+        self.canvas.delete(self.line)
+        self.line = None
+        self.coordinates = []
 
-            points[i] = [p1[0], p1[1], p2[0], p2[1], 1]
+        self.drawing = self.simplify(self.drawing)
+        item = { "type": self.name, "info": self.get_info() }
+        data.add(item)
+        self.index.insert(item)
 
-        points[-1] = [points[-1][0], points[-1][1], points[-1][0], points[-1][1], 1]
+    def simplify(self, points):
+        with span('simplify', points=len(points)) as traced:
+            points, ratio = simplify(points, self.tolerance)
+            traced.set(kept=len(points), ratio=round(ratio, 3))
 
         return points
 
-    def get_slope(self, point1, point2):
-        x0, y0 = point1
-        x1, y1 = point2
-
-        if x0 - x1 == 0: return 'vertical'
-        
-        return y1-y0/x1-x0
-
     def get_info(self):
-        return self.drawing
+        return Stroke(self.drawing)
 
     def blur_spline(self, spline):
-        for i in range(len(spline["info"])):
-            spline["info"][i][-1] = 0
+        spline["info"].flags |= Stroke.BLURRED
 
         return spline
 
     @staticmethod
     def render(canvas, info):
-        for x0, y0, x1, y1, alpha in info:
-            canvas.create_line(x0, y0, x1, y1, fill="black" if alpha == 1 else "red", width=1)
+        fill = "red" if info.is_blurred() else "black"
+
+        if len(info) == 0: return []
+
+        # One polyline item for the whole stroke, a single point is drawn as a line of zero length
+        points = info.points if len(info) > 1 else np.vstack((info.points, info.points))
+
+        return [canvas.create_line(*points.ravel().tolist(), fill=fill, width=1)]
 
     @staticmethod
-    def export_render(engine, page, image, info):
-        (height, width, _) = image.shape
+    def style(info):
+        return info.flags
+
+    @staticmethod
+    def export_batch(engine, shape, infos, scale):
+        # Every stroke becomes a subpath of the same path, stroked once and left open so its ends are not joined
+        # The operators are written straight into the shape, all points are moved into the page's coordinate
+        # system at once, which is what draw_polyline does one Point at a time
+        if len(infos) == 0: return
 
-        scale = 1 / min(721 / width, 1020 / height)
+        points = np.concatenate(list(map(lambda e: e.points, infos))).astype(np.float64) * scale
+        matrix = shape.ipctm
 
-        points = list(map(lambda e: [e[0] * scale, e[1] * scale], info))
-        shape = page.new_shape()
-        shape.draw_polyline(points)
-        shape.finish(width = 0.3, color = (0, 0, 0), fill = (1, 1, 1), fill_opacity=0)
-        shape.commit()
+        x = points[:, 0] * matrix.a + points[:, 1] * matrix.c + matrix.e
+        y = points[:, 0] * matrix.b + points[:, 1] * matrix.d + matrix.f
 
+        # Each stroke starts with a move to its first point, the rest are lines
+        operators = np.full(len(points), 'l')
+        operators[np.cumsum([0] + list(map(len, infos[:-1])))] = 'm'
+
+        shape.draw_cont += ''.join(map('%g %g %s\n'.__mod__, zip(x.tolist(), y.tolist(), operators.tolist())))
+        shape.finish(width = 0.3, color = (0, 0, 0), closePath = False)
 
 class Text(Tool):
-    def __init__(self, canvas, update):
-        super().__init__(canvas, update)
+    def __init__(self, canvas, update, index=None, view=None):
+        super().__init__(canvas, update, index, view)
 
         self.name = "text"
         
@@ -364,8 +645,35 @@ class Text(Tool):
 
     @staticmethod
     def render(canvas, info):
-        pass
+        return []
 
     @staticmethod
-    def export_render(engine, page, image, info):
-        pass
\ No newline at end of file
+    def style(info):
+        return None
+
+    @staticmethod
+    def export_batch(engine, shape, infos, scale):
+        pass
+
+# Every annotation type, the class that draws and exports it and the layer it is exported in,
+# shared by the editor and the headless exporter
+TOOLS = {
+    'highlight': {
+        "icon": "./icons/highlight.png",
+        "class": Highlighter,
+        "export_layer": "behind"
+    },
+    'pencil': {
+        "icon": "./icons/pencil.png",
+        "class": Pencil,
+        "export_layer": "above"
+    },
+    'text': {
+        "icon": "./icons/text.png",
+        "class": Text,
+        "export_layer": "above"
+    },
+    # 'eraser': {
+    #     "icon": "./icons/eraser.png"
+    # },
+}
@@ -0,0 +1,391 @@
+import os
+import io
+import json
+import hashlib
+import multiprocessing
+import fitz
+import cv2 as cv
+import numpy as np
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+
+from classes import PageProvider, InkExtractor, export_scale
+from stroke import encode
+import timing
+from timing import span
+from filecache import atomic_save
+
+EXPORT_CACHE = './.cache/export' # Encoded ink layers and page hashes of incremental exports
+
+# Passed to doc.save for every export, garbage collection drops unused objects, deflate compresses the
+# uncompressed streams and object streams pack the small objects together
+SAVE_OPTIONS = { "garbage": 3, "deflate": True, "use_objstms": 1 }
+
+class PageEncoding:
+    # How the ink layer of a raster export is stored in the PDF
+    # 'png' is the lossless BGRA page, 'bilevel' a 1-bit ink mask over the ink colours as a JPEG at a reduced
+    # resolution, 'jpeg' the colour as JPEG with the alpha as a Flate (grayscale PNG) soft mask, 'palette' a PNG
+    # quantized to a few colours
+    # level is the PNG compression level (0-9, None for OpenCV's default), quality the JPEG quality
+    FORMATS = ['png', 'bilevel', 'jpeg', 'palette']
+    REDUCTION = 2 # Factor the colour plane of 'bilevel' is scaled down by on each axis
+
+    def __init__(self, format='png', level=None, quality=85, colors=16):
+        if format not in PageEncoding.FORMATS:
+            raise ValueError(f'Unknown page encoding "{format}"')
+
+        self.format = format
+        self.level = level
+        self.quality = quality
+        self.colors = colors
+
+    def png(self, image, bilevel=False):
+        parameters = [] if self.level == None else [cv.IMWRITE_PNG_COMPRESSION, self.level]
+        if bilevel: parameters += [cv.IMWRITE_PNG_BILEVEL, 1]
+
+        _, buffer = cv.imencode('.png', image, parameters)
+
+        return buffer.tobytes()
+
+    def encode(self, image):
+        # Returns the image stream and its mask stream for insert_image, the mask is None when the image carries its alpha
+        alpha = image[:, :, 3]
+
+        if self.format == 'png':
+            return (self.png(image), None)
+
+        if self.format == 'bilevel':
+            # The shape of the ink is kept sharp by the full resolution mask, the colour under it only has to be
+            # close, so it is stored smaller and lossy
+            # Only ink pixels are averaged into the smaller plane, the paper would lighten the edges of the strokes,
+            # and areas without ink take the mean ink colour so they don't bleed into their neighbours
+            (height, width, _) = image.shape
+            size = (max(1, width // PageEncoding.REDUCTION), max(1, height // PageEncoding.REDUCTION))
+
+            mask = cv.extractChannel(image, 3)
+            colour = cv.cvtColor(image, cv.COLOR_BGRA2BGR)
+            colour = cv.bitwise_and(colour, colour, mask=mask)
+
+            # Averaging the paper as black and dividing by the share of ink in each pixel leaves the mean ink colour
+            weight = cv.resize(mask, size, interpolation=cv.INTER_AREA)
+            colour = cv.resize(colour, size, interpolation=cv.INTER_AREA)
+
+            coverage = cv.mean(weight)[0]
+            mean = np.array(cv.mean(colour)[:3]) * 255 / coverage if coverage != 0 else np.zeros(3)
+
+            colour = cv.divide(colour, cv.merge([weight, weight, weight]), scale=255)
+            np.copyto(colour, mean.astype(np.uint8), where=(weight == 0)[:, :, None])
+
+            _, buffer = cv.imencode('.jpg', colour, [cv.IMWRITE_JPEG_QUALITY, self.quality])
+
+            return (buffer.tobytes(), self.png(mask, bilevel=True))
+
+        if self.format == 'jpeg':
+            _, buffer = cv.imencode('.jpg', image[:, :, :3], [cv.IMWRITE_JPEG_QUALITY, self.quality])
+
+            return (buffer.tobytes(), self.png(alpha))
+
+        # The palette is built from the ink pixels alone, so no entry is spent on shades of the paper, and the
+        # paper gets an extra entry that is made transparent
+        ink = alpha != 0
+        colours = np.ascontiguousarray(image[:, :, :3][ink])
+
+        indices = np.full(alpha.shape, self.colors - 1, dtype=np.uint8)
+        palette = []
+
+        if len(colours) != 0:
+            # The ink pixels as a one pixel wide image, their palette indices come back in the same order
+            quantized = Image.frombuffer('RGB', (1, len(colours)), colours, 'raw', 'BGR', 0, 1).quantize(self.colors - 1, method=Image.Quantize.MEDIANCUT)
+
+            indices[ink] = np.array(quantized).ravel()
+            palette = quantized.getpalette()[:3 * (self.colors - 1)]
+
+        palette += [0] * (3 * (self.colors - 1) - len(palette)) + [255, 255, 255]
+
+        paletted = Image.fromarray(indices, 'P')
+        paletted.putpalette(palette)
+
+        options = {} if self.level == None else { "compress_level": self.level }
+
+        buffer = io.BytesIO()
+        paletted.save(buffer, 'PNG', transparency=self.colors - 1, **options)
+
+        return (buffer.getvalue(), None)
+
+# Each worker process opens its own copy of the document once and keeps it for every page it is given
+provider = None
+extractor = None
+encoding = None
+
+def initialize_worker(filename, dpi, mode, threshold, quality, page_encoding, trace):
+    global provider
+    global extractor
+    global encoding
+
+    provider = PageProvider(filename, dpi=dpi, capacity=1)
+    extractor = InkExtractor(mode=mode, threshold=threshold, quality=quality)
+    encoding = page_encoding
+
+    # A forked worker starts with a copy of the main process' spans, only its own are sent back
+    timing.enabled = trace
+    timing.collect()
+
+def render_page(index):
+    # Rasterize, extract the ink and encode, only the encoded bytes and the spans recorded meanwhile travel back
+    # to the main process
+    image = extractor.extract(provider.get_image(index))
+
+    (height, width, _) = image.shape
+
+    with span('encode', page=index, format=encoding.format):
+        stream, mask = encoding.encode(image)
+
+    return (width, height, stream, mask, timing.collect())
+
+def get_layers(tools):
+    behind = list(map(lambda e: e[0], filter(lambda e: e[1]["export_layer"] == "behind", tools.items())))
+    above = list(map(lambda e: e[0], filter(lambda e: e[1]["export_layer"] == "above", tools.items())))
+
+    return [behind, above]
+
+class AnnotationWriter:
+    # Writes the annotations of a page layer into a single shape, each tool draws all of its annotations at once
+    # and styles them with one finish, and the scale onto the page is computed once per page
+    def __init__(self, tools):
+        self.tools = tools
+        self.layers = dict(zip(['behind', 'above'], get_layers(tools)))
+
+    def write(self, page, width, height, annotations, layer):
+        groups = {} # type -> infos, in the order the types first appear
+
+        for item in annotations:
+            if item["type"] in self.layers[layer]:
+                groups.setdefault(item["type"], []).append(item["info"])
+
+        if len(groups) == 0: return
+
+        with span('annotations', layer=layer, count=sum(map(len, groups.values()))):
+            scale = export_scale(width, height)
+            shape = page.new_shape()
+
+            for _type, infos in groups.items():
+                self.tools[_type]["class"].export_batch(fitz, shape, infos, scale)
+
+            shape.commit()
+
+def get_context():
+    # Forking starts the workers without re-running the editor script as their main module
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+
+    return multiprocessing.get_context()
+
+def insert_page(doc, position, width, height, stream, mask, annotations, writer):
+    # A raster page: the annotations of the behind layer, the encoded ink layer and the annotations above it
+    page = doc.new_page(position, width = width, height = height)
+
+    writer.write(page, width, height, annotations, 'behind')
+
+    with span('insert_image'):
+        page.insert_image(fitz.Rect(0, 0, width, height), stream=stream, mask=mask)
+
+    writer.write(page, width, height, annotations, 'above')
+
+    return page
+
+def render_pages(processor, indices, workers=1, lock=None, encoding=None):
+    # Yields (index, (width, height, stream, mask)) for each page in order, in a pool of worker processes
+    # when there is more than one worker and more than one page
+    pages = processor.pages
+    extractor = processor.extractor
+    encoding = encoding or PageEncoding()
+    indices = list(indices)
+
+    if workers <= 1 or len(indices) <= 1:
+        for i in indices:
+            image = processor.get_image(i)
+            (height, width, _) = image.shape
+
+            with span('encode', page=i, format=encoding.format):
+                yield (i, (width, height, *encoding.encode(image)))
+
+        return
+
+    arguments = (pages.filename, pages.dpi, extractor.mode, extractor.threshold, extractor.quality, encoding, timing.enabled)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context(), initializer=initialize_worker, initargs=arguments) as pool:
+        # The workers are forked on the first submission, holding the processor lock keeps the
+        # prefetch thread from being inside fitz at that moment
+        if lock != None:
+            with lock:
+                results = pool.map(render_page, indices)
+        else:
+            results = pool.map(render_page, indices)
+
+        # Results arrive in page order, so the document is assembled as they complete
+        for i, (width, height, stream, mask, recorded) in zip(indices, results):
+            timing.merge(recorded)
+            yield (i, (width, height, stream, mask))
+
+def export_parallel(processor, history, tools, output='exported.pdf', workers=None, lock=None, encoding=None, save_options=SAVE_OPTIONS):
+    workers = workers or os.cpu_count() or 1
+    writer = AnnotationWriter(tools)
+
+    doc = fitz.open()
+
+    for i, (width, height, stream, mask) in render_pages(processor, range(len(processor.pages)), workers, lock, encoding):
+        insert_page(doc, -1, width, height, stream, mask, history[i], writer)
+
+    with span('save', output=output):
+        doc.save(output, **save_options)
+    doc.close()
+
+def export_serial(processor, history, tools, output='exported.pdf', encoding=None, save_options=SAVE_OPTIONS):
+    export_parallel(processor, history, tools, output, workers=1, encoding=encoding, save_options=save_options)
+
+class ExportCache:
+    # Encoded ink layers by the hash of their source page and processing, plus the page hashes of every output
+    # exported through the cache, so a re-export only renders the pages whose source changed and only rewrites
+    # the pages whose hash changed
+    def __init__(self, directory=EXPORT_CACHE):
+        self.directory = directory
+        self.path = os.path.join(directory, 'manifest.json')
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.outputs = {} # Absolute output path -> { "size", "modified", "full", "pages", "layers" }
+        if os.path.exists(self.path):
+            with open(self.path, "r") as file:
+                self.outputs = json.loads(file.read())
+
+    def layer_path(self, key):
+        return os.path.join(self.directory, f'{key}.npz')
+
+    def get_layer(self, key):
+        path = self.layer_path(key)
+        if not os.path.exists(path): return None
+
+        with np.load(path) as layer:
+            width, height = layer["size"].tolist()
+            mask = layer["mask"].tobytes() if layer["masked"] else None
+
+            return (width, height, layer["stream"].tobytes(), mask)
+
+    def put_layer(self, key, width, height, stream, mask):
+        def write(file):
+            np.savez(file, size=np.array([width, height]), stream=np.frombuffer(stream, dtype=np.uint8),
+                     mask=np.frombuffer(mask or b'', dtype=np.uint8), masked=mask != None)
+
+        atomic_save(self.layer_path(key), write)
+
+    def get_output(self, output):
+        # The recorded pages are only trusted while the output is the file this cache last wrote
+        entry = self.outputs.get(os.path.abspath(output))
+        if entry == None or not os.path.exists(output): return None
+
+        stat = os.stat(output)
+        if stat.st_size != entry["size"] or stat.st_mtime_ns != entry["modified"]: return None
+
+        return entry
+
+    def put_output(self, output, hashes, layers, full):
+        stat = os.stat(output)
+
+        self.outputs[os.path.abspath(output)] = { "size": stat.st_size, "modified": stat.st_mtime_ns, "full": full, "pages": hashes, "layers": layers }
+
+        atomic_save(self.path, lambda file: file.write(json.dumps(self.outputs)), mode="w")
+
+        self.prune()
+
+    def prune(self):
+        # Layers no output refers to anymore are deleted, so the cache holds at most one layer per exported page
+        used = set(key for entry in self.outputs.values() for key in entry["layers"])
+
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz') and name[:-len('.npz')] not in used:
+                os.remove(os.path.join(self.directory, name))
+
+def hash_of(*values):
+    return hashlib.sha1(json.dumps(values, default=encode).encode()).hexdigest()
+
+def export_incremental(processor, history, tools, output='exported.pdf', workers=1, lock=None, encoding=None, cache=None, save_options=SAVE_OPTIONS):
+    # Raster export that reuses the previous output: pages whose hash (source page, processing and annotations)
+    # is unchanged are kept, changed ones are replaced and appended as an incremental update
+    # Returns the indices of the pages that were written
+    pages = processor.pages
+    extractor = processor.extractor
+    encoding = encoding or PageEncoding()
+    cache = cache or ExportCache()
+    writer = AnnotationWriter(tools)
+    layers = get_layers(tools)
+
+    document = pages.get_hash()
+    settings = (pages.dpi, extractor.mode, extractor.threshold, extractor.quality, encoding.format, encoding.level, encoding.quality, encoding.colors)
+
+    keys = [hash_of(document, i, settings) for i in range(len(pages))]
+    hashes = [hash_of(keys[i], list(history[i]), layers) for i in range(len(pages))]
+
+    previous = cache.get_output(output)
+
+    # Every incremental update appends the replaced pages, once the file has doubled it is written from scratch
+    full = previous == None or len(previous["pages"]) != len(hashes) or previous["size"] > 2 * previous["full"]
+
+    changed = list(range(len(pages))) if full else [i for i in range(len(hashes)) if hashes[i] != previous["pages"][i]]
+
+    if not full and len(changed) == 0:
+        return changed
+
+    # Ink layers come from the cache, only the missing ones are rendered and encoded
+    encoded = {}
+    for i in changed:
+        encoded[i] = cache.get_layer(keys[i])
+
+    missing = [i for i in changed if encoded[i] == None]
+    for i, layer in render_pages(processor, missing, workers, lock, encoding):
+        cache.put_layer(keys[i], *layer)
+        encoded[i] = layer
+
+    if full:
+        doc = fitz.open()
+
+        for i in changed:
+            insert_page(doc, -1, *encoded[i], history[i], writer)
+
+        with span('save', output=output):
+            doc.save(output, **save_options)
+    else:
+        doc = fitz.open(output)
+
+        for i in changed:
+            doc.delete_page(i)
+            insert_page(doc, i, *encoded[i], history[i], writer)
+
+        # Garbage collection and object streams rewrite the whole file, only deflate applies to an incremental update
+        with span('save', output=output, incremental=True):
+            doc.save(output, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP, deflate=save_options.get("deflate", False))
+
+    doc.close()
+
+    cache.put_output(output, hashes, keys, os.path.getsize(output) if full else previous["full"])
+
+    return changed
+
+def export_vector(filename, history, tools, output='exported.pdf', save_options=SAVE_OPTIONS):
+    # Annotates the original document instead of rebuilding it, so its text, vectors and images are kept as they are
+    writer = AnnotationWriter(tools)
+
+    doc = fitz.open(filename)
+
+    for i in range(min(doc.page_count, len(history))):
+        page = doc[i]
+
+        # Annotations are stored in fitted canvas coordinates, scaling them to the page size in points places them
+        # exactly where they would land on a raster of any resolution
+        # Both layers are drawn over the page content, an opaque image or a scan would hide anything behind it,
+        # the behind layer is blended instead (highlights multiply) and stays below the annotations above it
+        writer.write(page, page.rect.width, page.rect.height, history[i], 'behind')
+        writer.write(page, page.rect.width, page.rect.height, history[i], 'above')
+
+    with span('save', output=output):
+        doc.save(output, **save_options)
+    doc.close()
@@ -0,0 +1,30 @@
+import os
+
+def atomic_save(path, write, mode='wb'):
+    # Writes the file next to its final name and renames it into place, so a partially written file is never read
+    # write is called with the open temporary file
+    temporary = path + '.tmp'
+
+    with open(temporary, mode) as file:
+        write(file)
+
+    os.replace(temporary, path)
+
+def evict(entries, limit, remove=os.remove):
+    # Removes the least recently used of the (last use, size, path) entries until the rest fit into limit bytes,
+    # the most recent entry is always kept, even if it alone is over the limit
+    # Returns the size of the entries that are left
+    entries = sorted(entries)
+    size = sum(map(lambda e: e[1], entries))
+
+    for _, nbytes, path in entries[:-1]:
+        if size <= limit: break
+
+        try:
+            remove(path)
+        except OSError:
+            continue # Still in use on Windows, or already removed by another process
+
+        size -= nbytes
+
+    return size
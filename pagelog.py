@@ -0,0 +1,125 @@
+from collections import deque
+
+UNDO_LIMIT = 1000 # Operations kept for undo on every page
+
+HEAD = None # Key of the sentinel that comes before the first and after the last annotation
+
+class PageLog:
+    # The annotations of a page together with the operations that changed them, every edit goes through add
+    # or remove and is recorded with what is needed to reverse it, so undo and redo replay a single
+    # operation instead of restoring a copy of the page
+    # Styles are not edits, the eraser's blur only marks strokes until they are removed and is never undone
+    # The annotations are a doubly linked list keyed by id(), a removed annotation remembers the one before it,
+    # so removing and putting it back costs the same whatever the size of the page, and undo, which runs the
+    # operations in reverse, always finds that neighbour in place
+    # It reads like the list of annotations it replaces, iterating, indexing and len work the same
+    def __init__(self, items=()):
+        self.items = {} # id(annotation) -> annotation
+        self.next = { HEAD: HEAD }
+        self.previous = { HEAD: HEAD }
+
+        for item in items:
+            self.link(item, self.previous[HEAD])
+
+        self.done = deque(maxlen=UNDO_LIMIT) # Operations that can be undone, newest last
+        self.undone = [] # Operations that can be redone, newest last
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        key = self.next[HEAD]
+
+        while key != HEAD:
+            yield self.items[key]
+            key = self.next[key]
+
+    def __getitem__(self, index):
+        # Walks the list, only the iteration order is kept
+        return list(self)[index]
+
+    def __repr__(self):
+        return f'PageLog({list(self)!r})'
+
+    def link(self, item, after):
+        key = id(item)
+        following = self.next[after]
+
+        self.items[key] = item
+        self.next[after] = key
+        self.previous[key] = after
+        self.next[key] = following
+        self.previous[following] = key
+
+    def unlink(self, item):
+        # Returns the key of the annotation that came before it
+        key = id(item)
+        after = self.previous.pop(key)
+        following = self.next.pop(key)
+
+        del self.items[key]
+        self.next[after] = following
+        self.previous[following] = after
+
+        return after
+
+    def record(self, operation):
+        self.done.append(operation)
+        self.undone.clear()
+
+    def add(self, item):
+        self.link(item, self.previous[HEAD])
+        self.record(('add', item))
+
+    def remove(self, items):
+        # Removes several annotations as one operation, each with the annotation it followed
+        removed = []
+
+        for item in items:
+            if id(item) in self.items:
+                removed.append((item, self.unlink(item)))
+
+        if len(removed) == 0: return
+
+        self.record(('remove', removed))
+
+    def apply(self, operation, reverse):
+        # Returns the annotations the operation added and removed, so the caller can update its index
+        if operation[0] == 'add':
+            if reverse:
+                self.unlink(operation[1])
+                return ([], [operation[1]])
+
+            self.link(operation[1], self.previous[HEAD])
+            return ([operation[1]], [])
+
+        items = list(map(lambda e: e[0], operation[1]))
+
+        # Put back in the reverse order they were taken out, so every neighbour is in place again
+        if reverse:
+            for item, after in reversed(operation[1]):
+                self.link(item, after)
+
+            return (items, [])
+
+        for item in items:
+            self.unlink(item)
+
+        return ([], items)
+
+    def undo(self):
+        # Returns (added, removed) annotations, or None when there is nothing to undo
+        if len(self.done) == 0: return None
+
+        operation = self.done.pop()
+        self.undone.append(operation)
+
+        return self.apply(operation, reverse=True)
+
+    def redo(self):
+        if len(self.undone) == 0: return None
+
+        operation = self.undone.pop()
+        self.done.append(operation)
+
+        return self.apply(operation, reverse=False)
@@ -0,0 +1,124 @@
+from timing import span
+
+class ViewTransform:
+    # Maps page units (the fitted canvas coordinates annotations are stored in) to canvas coordinates,
+    # canvas = page * zoom + offset, at a zoom of 1 and no offset both are the same
+    def __init__(self, zoom=1.0, x=0.0, y=0.0):
+        self.zoom = zoom
+        self.x = x
+        self.y = y
+
+    def copy(self):
+        return ViewTransform(self.zoom, self.x, self.y)
+
+    def to_canvas(self, x, y):
+        return (x * self.zoom + self.x, y * self.zoom + self.y)
+
+    def to_page(self, x, y):
+        return ((x - self.x) / self.zoom, (y - self.y) / self.zoom)
+
+    def map(self, coordinates):
+        # Flat [x0, y0, x1, y1, ...] list in page units to the same list in canvas coordinates
+        return [value * self.zoom + (self.x if i % 2 == 0 else self.y) for i, value in enumerate(coordinates)]
+
+    def zoom_at(self, x, y, factor, minimum=0.25, maximum=16.0):
+        # Zooms around a canvas position, the page point under it stays where it is
+        zoom = min(max(self.zoom * factor, minimum), maximum)
+        px, py = self.to_page(x, y)
+
+        self.zoom = zoom
+        self.x = x - px * zoom
+        self.y = y - py * zoom
+
+    def pan(self, dx, dy):
+        self.x += dx
+        self.y += dy
+
+    def reset(self):
+        self.zoom = 1.0
+        self.x = 0.0
+        self.y = 0.0
+
+    def apply(self, canvas, tag):
+        # Items drawn in page units are moved into place, the same as drawing them with mapped coordinates
+        canvas.scale(tag, 0, 0, self.zoom, self.zoom)
+        canvas.move(tag, self.x, self.y)
+
+class CanvasRenderer:
+    # Keeps the canvas items of every annotation of the page, so a redraw only creates, deletes or restyles
+    # the items of the annotations that changed instead of drawing the whole page again
+    def __init__(self, canvas, tools, view=None):
+        self.canvas = canvas
+        self.tools = tools
+        self.view = view if view != None else ViewTransform()
+
+        self.items = {} # id(annotation) -> [annotation, canvas item ids, style]
+        self.image = None # Canvas item of the page image, annotations are kept below it
+
+    def reset(self):
+        self.canvas.delete('all')
+
+        self.items = {}
+        self.image = None
+
+    def set_image(self, image, x=0, y=0):
+        # No image means no part of the page is inside the viewport
+        if image == None: image = ''
+
+        if self.image == None:
+            self.image = self.canvas.create_image(x, y, anchor='nw', image=image)
+        else:
+            self.canvas.itemconfig(self.image, image=image)
+            self.canvas.coords(self.image, x, y)
+
+    def draw(self, item):
+        # Tools render in page units, the items are then tagged and moved into the current view
+        ids = self.tools[item["type"]]["class"].render(self.canvas, item["info"])
+
+        for _id in ids:
+            self.canvas.addtag_withtag('annotation', _id)
+            self.view.apply(self.canvas, _id)
+
+            if self.image != None:
+                self.canvas.tag_lower(_id, self.image)
+
+        return ids
+
+    def transform(self, previous):
+        # Moves every annotation item from the previous view into the current one without redrawing them,
+        # canvas' = (canvas - offset) * zoom' / zoom + offset'
+        factor = self.view.zoom / previous.zoom
+
+        self.canvas.scale('annotation', previous.x, previous.y, factor, factor)
+        self.canvas.move('annotation', self.view.x - previous.x, self.view.y - previous.y)
+
+    def sync(self, data):
+        with span('redraw', annotations=len(data)):
+            self.update(data)
+
+    def update(self, data):
+        # The annotation is kept in its entry, so its id can not be reused by a new annotation while it is tracked
+        seen = set()
+
+        for item in data:
+            key = id(item)
+            seen.add(key)
+
+            style = self.tools[item["type"]]["class"].style(item["info"])
+            entry = self.items.get(key)
+
+            if entry == None:
+                self.items[key] = [item, self.draw(item), style]
+            elif entry[2] != style:
+                self.canvas.delete(*entry[1])
+
+                entry[1] = self.draw(item)
+                entry[2] = style
+
+        for key in list(self.items.keys()):
+            if key in seen: continue
+
+            if len(self.items[key][1]) != 0:
+                self.canvas.delete(*self.items[key][1])
+
+            del self.items[key]
@@ -1,35 +1,16 @@
-import sys
-import random, pyperclip, json
-from pdf2image import convert_from_path
-import fitz
-import io 
-import numpy as np
-import cv2 as cv
+import sys, os, math, threading
 from tkinter import *
-from PIL import Image, ImageTk
-
-from classes import Session, Processor, Highlighter, Pencil, Text
-
-tools = {
-    'highlight': {
-        "icon": "./icons/highlight.png",
-        "class": Highlighter,
-        "export_layer": "behind"
-    },
-    'pencil': {
-        "icon": "./icons/pencil.png",
-        "class": Pencil,
-        "export_layer": "above"
-    },
-    'text': {
-        "icon": "./icons/text.png",
-        "class": Text,
-        "export_layer": "above"
-    },
-    # 'eraser': {
-    #     "icon": "./icons/eraser.png"
-    # },
-}
+
+from store import Session
+from spatial import SpatialIndex
+from pagelog import PageLog
+from renderer import CanvasRenderer, ViewTransform
+import timing
+from timing import span
+
+# The processing modules (classes, exporter and zoompan, which bring in cv2, fitz and PIL) are imported by
+# load_document on a worker thread once a session is chosen, the Session Manager only needs the store
+tools = None
 
 def log_data(data):
     if len(data) == 0: return 'no types present'
@@ -43,23 +24,24 @@ def log_data(data):
         else:
             types[_type] = 1
 
-    message = list(map(lambda e: f'{e[1]} {e[0]} type{"s" if e[1] != 1 else ""}', types.items()))
-    message[-1] = 'and ' + message[-1] if len(message) != 1 else message[-1]
+    return log_counts(types)
+
+def log_counts(counts):
+    if len(counts) == 0: return 'no types present'
 
-    message = ', '.join(message)
+    message = list(map(lambda e: f'{e[1]} {e[0]} type{"s" if e[1] != 1 else ""}', counts.items()))
+    message[-1] = 'and ' + message[-1] if len(message) != 1 else message[-1]
 
-    return message
+    return ', '.join(message)
 
 # FIXME: Highlight rectangles can only be created from the top left
-# FIXME: Exporting on last page removes pencil lines
-# FIXME: Exported pencil lines connect start and end points
 
 # TODO: Zoom out of large images to achieve an editable window size (*)
 # TODO: Add save functionality (*)
 # TODO: Retain history between pages (*)
 # TODO: Add pencil tool (*)
 # TODO: Organize pencil and highlight into tools (*)
-# TODO: Add zoom in/out tool
+# TODO: Add zoom in/out tool (*)
 
 # images = []
 # for i in range(1, 13):
@@ -71,49 +53,118 @@ def log_data(data):
 
 pdf = 'file.pdf'
 
-# images = convert_from_path(pdf)
-images = convert_from_path(pdf)[0:2]
-print(f'Got {len(images)} image(s)')
+# Spans of page loads, redraws, saves and exports are traced with --trace or PDF_EDITOR_TRACE=<path>,
+# the trace is written to trace.json when the editor exits
+if '--trace' in sys.argv: timing.enable()
+
+# 'raster' rebuilds every page from its extracted ink, 'vector' draws the annotations onto the original document
+EXPORT_MODE = 'raster'
+
+# Pages are rasterized, extracted and encoded in this many processes on export, 1 exports serially on the Tk thread
+EXPORT_WORKERS = os.cpu_count() or 1
+
+# How raster exports store the ink layer, one of 'png', 'bilevel', 'jpeg' or 'palette' (see exporter.PageEncoding)
+EXPORT_ENCODING = 'png'
+
+# Raster exports keep the pages of the previous export whose source, processing and annotations did not change
+EXPORT_INCREMENTAL = True
+
+# Pages are rasterized on demand by the provider, nothing is rendered until the editor asks for a page
+images = None # Provider of the open document, set by load_document
+loader = None # Thread running load_document
 
 rects = []
 session = None
 
-processor = Processor(images)
+processor = None
+
+root = None
+canvas = None
+
+view = ViewTransform() # Zoom and pan of the page, shared by the renderer, the page view and the tools
+renderer = None # Canvas items of the page image and its annotations
+page_view = None # Crops and resamples the visible part of the page from its image pyramid
 
-root = Tk()
-root.geometry('721x1020+1+1')
-# root.geometry('0x0+0+0')
-root.title("Highlighter")
-canvas = Canvas(root)
-canvas.pack()
+ZOOM_STEP = 1.25
 
 
-data = [] # Data in current page
-history = [[]] * len(images) # Data across all pages
+data = PageLog() # Data in current page, the log of the page in history
+index = SpatialIndex() # Spatial index over data, shared with the tools
+history = [] # Data across all pages, a PageLog per page
 current_tool = 'highlight'
 active_class = None
 
 active = False # Active in a current session
 holding = False # If the highlight tool is held down
+panning = None # Last pointer position while the page is dragged with the middle button
 page = 0
 
 image = None
+shown_dpi = None # Resolution the page image on the canvas was rasterized at
 
-print('Initialized')
+def load_document(filename):
+    # Runs on a worker thread, nothing here may touch Tk
+    global images
+    global processor
+    global tools
+    global exporter
+    global PageView
 
-def update_canvas():
-    canvas.delete('all')
+    with span('load_document', file=filename):
+        from classes import PageProvider, Processor, TOOLS
+        from zoompan import PageView
+        import exporter
 
-    for item in data:
-        tools[item["type"]]["class"].render(canvas, item["info"])
-        
-    canvas.create_image(0,0, anchor=NW, image=image) # Page image
+        tools = TOOLS
+        images = PageProvider(filename)
+        processor = Processor(images)
+
+        print(f'Opened {len(images)} page(s)')
+
+        # The first page is processed while the window waits, so the editor opens on a cache hit
+        processor.get_image(page, preview_dpi())
+
+def open_document(filename, then):
+    # The document is loaded in the background, then is called on the Tk thread once it is ready
+    global loader
+
+    root.title("Highlighter (loading)")
+
+    loader = threading.Thread(target=load_document, args=(filename,), daemon=True)
+    loader.start()
+
+    wait_for_document(then)
+
+def wait_for_document(then):
+    if loader.is_alive():
+        root.after(20, lambda: wait_for_document(then))
+        return
+
+    if processor == None:
+        print('Failed to load the document')
+        return
+
+    initialize_editor()
+    then()
+
+def initialize_editor():
+    global renderer
+    global page_view
+
+    renderer = CanvasRenderer(canvas, tools, view)
+    page_view = PageView(canvas, view)
+
+    create_toolbar()
+
+def update_canvas():
+    # Only the annotations that were added, removed or restyled since the last update are redrawn
+    renderer.sync(data)
 
     session.change_data(page, data)
 
 def initialize_tool(reference):
     global canvas
-    return reference(canvas, update_canvas)
+    return reference(canvas, update_canvas, index, view)
 
 def on_tool_change(new_tool):
     global current_tool
@@ -132,113 +183,142 @@ def log_history():
         print(f'Page {i + 1}: {log_data(history[i])}')
 
 
-def get_tool_layers():
-    print(list(tools.items()))
-
-    for thing in list(tools.items()):
-        print(thing[1])
-    behind = list(map(lambda e: e[0], filter(lambda e: e[1]["export_layer"] == "behind", list(tools.items()))))
-    above = list(map(lambda e: e[0], filter(lambda e: e[1]["export_layer"] == "above", list(tools.items()))))
-
-    return [behind, above]
-
 def export():
-    doc = fitz.open()
-
-    for i in range(len(images)):
-        image = processor.get_image(i)
-
-        (height, width, _) = image.shape
-
-        page = doc.new_page(-1,
-                            width = width,
-                            height = height)
-        
+    with span('export', mode=EXPORT_MODE, workers=EXPORT_WORKERS):
+        if EXPORT_MODE == 'vector':
+            exporter.export_vector(session.file, history, tools)
+        elif EXPORT_INCREMENTAL:
+            changed = exporter.export_incremental(processor, history, tools, workers=EXPORT_WORKERS, lock=processor.lock, encoding=exporter.PageEncoding(EXPORT_ENCODING))
+            print(f'Exported {len(changed)} changed page(s)')
+        elif EXPORT_WORKERS > 1:
+            exporter.export_parallel(processor, history, tools, workers=EXPORT_WORKERS, lock=processor.lock, encoding=exporter.PageEncoding(EXPORT_ENCODING))
+        else:
+            exporter.export_serial(processor, history, tools, encoding=exporter.PageEncoding(EXPORT_ENCODING))
 
-        behind_tools, above_tools = get_tool_layers()
+def preview_dpi():
+    # Resolution the page is displayed at, the full DPI is only rasterized for export or once zooming in needs it
+    fit = images.fit_dpi(page, 721, 1020)
 
-        behind = list(filter(lambda e: e["type"] in behind_tools, history[i]))
-        above = list(filter(lambda e: e["type"] in above_tools, history[i]))
+    # Zooming in doubles the resolution in steps, so not every wheel tick rasterizes the page again
+    steps = math.ceil(math.log2(view.zoom)) if view.zoom > 1 else 0
 
-        for cluster in behind:
-            tools[cluster["type"]]["class"].export_render(fitz, page, image, cluster["info"])
+    return min(round(fit * 2 ** steps), images.dpi)
 
-        image_rect = fitz.Rect(0, 0, width, height)
+def load_image():
+    global image
+    global shown_dpi
 
-        _, buffer = cv.imencode('.png', image)
-        byte_array = np.array(buffer).tobytes()
-        
-        pixmap = fitz.Pixmap(byte_array)
+    shown_dpi = preview_dpi()
 
-        page.insert_image(image_rect, pixmap=pixmap) 
+    with span('get_image', page=page, dpi=shown_dpi):
+        image = processor.get_image(page, shown_dpi)
 
-        for cluster in above:
-            tools[cluster["type"]]["class"].export_render(fitz, page, image, cluster["info"])
-            
+    # Page units are the fitted canvas size, the same at every resolution, so the annotations stay in place
+    (height, width, _) = image.shape
+    scale = min(721 / width, 1020 / height)
 
+    # Only the pyramid is built here, show_page resamples the part of it that is visible
+    page_view.set_image(image, scale)
 
-    doc.save('exported.pdf')
-    doc.close()
+    return (width * scale, height * scale)
 
 def update_all():
     global canvas
     global highlight
-    global image
-
-    canvas.delete('all')
 
-    image = processor.get_image(page)
-
-    print(f'Got first image')
-
-    (height, width, _) = image.shape
-    scale = min(721 / width, 1020 / height)
+    renderer.reset()
 
-    height *= scale
-    width *= scale
+    (width, height) = load_image()
 
     root.title("Highlighter")
     root.configure(width=width, height=height)
 
     canvas.config(width=width, height=height)
 
-    image = cv.cvtColor(image, cv.COLOR_BGRA2RGBA)
-    image = cv.resize(image, (int(width), int(height)), interpolation=cv.INTER_AREA)
-    print(f'Resized image')
+    show_page()
+
+    # Process the neighbouring pages in the background so the next page turn is a cache hit
+    processor.prefetch(page, shown_dpi)
+
+
+def show_page():
+    result = page_view.render()
 
-    image = Image.fromarray(image)
-    image = ImageTk.PhotoImage(image=image)
+    if result == None:
+        renderer.set_image(None)
+    else:
+        renderer.set_image(*result)
+
+def change_view(change):
+    # Applies a change to the view, then moves the annotations and resamples the visible part of the page
+    previous = view.copy()
+    change()
 
-    canvas.create_image(0,0, anchor=NW, image=image)  
+    renderer.transform(previous)
 
-    print(f'Created image')
+    # The page is rasterized again once it is zoomed in further than its resolution can show
+    if preview_dpi() > shown_dpi:
+        load_image()
 
+    show_page()
+
+def on_wheel(event):
+    if not active: return
+
+    factor = ZOOM_STEP if event.num == 4 or event.delta > 0 else 1 / ZOOM_STEP
+
+    change_view(lambda: view.zoom_at(event.x, event.y, factor))
 
 def motion(event):
     if not active: return
+
+    global panning
+
+    if panning != None:
+        x, y = panning
+        panning = (event.x, event.y)
+
+        change_view(lambda: view.pan(event.x - x, event.y - y))
+        return
+
     if not holding: return
 
     global data
 
-    active_class.on_move(event.x, event.y, data, right=(event.state == 1024))
+    active_class.on_move(*view.to_page(event.x, event.y), data, right=(event.state == 1024))
 
 def on_press(event):
     global holding
+    global panning
     if not active: return
     # if event.num == 3: return
 
+    # The middle button drags the page, the wheel buttons are handled by on_wheel
+    if event.num == 2:
+        panning = (event.x, event.y)
+        return
+
+    if event.num not in [1, 3]: return
+
     holding = True
 
-    active_class.on_press(event.x, event.y, right=(event.num == 3))
+    active_class.on_press(*view.to_page(event.x, event.y), right=(event.num == 3))
 
 def on_release(event):
     if not active: return
     global holding
+    global panning
     global data
 
+    if event.num == 2:
+        panning = None
+        return
+
+    if event.num not in [1, 3]: return
+
     holding = False
 
-    active_class.on_release(event.x, event.y, data=data, right=(event.state == 1024))
+    active_class.on_release(*view.to_page(event.x, event.y), data=data, right=(event.state == 1024))
 
     update_canvas()
 
@@ -251,6 +331,10 @@ def on_key(event):
     global page
     global data
 
+    if event.char == '0':
+        change_view(view.reset)
+        return
+
     if event.char not in ['f', 'd']: return
 
 
@@ -258,17 +342,12 @@ def on_key(event):
 
     if page + num < 0: return
 
-    history[page] = data.copy()
-
     print(f'Moving to {"next" if num > 0 else "previous"} page ({page} -> {page + num}), current page data:\n{log_data(data)}')
 
     pages = len(images)
     if page + num >= pages:
         print(f'Page "{page + num}" has reached the limit of "{pages}"')
 
-        history[-1] = data
-        data = []    
-
         export()
         return
     
@@ -277,56 +356,125 @@ def on_key(event):
     
     holding = False
 
-    data = history[page].copy()
+    # Have the autosaver write the page that was just left without waiting for its interval
+    Session.flush(wait=False)
+
+    data = history[page]
+    index.rebuild(data)
     
-    update_all()
+    with span('page_turn', page=page):
+        update_all()
+        update_canvas()
+
+def change_history(step):
+    # Undo or redo on the current page, the index is updated with the annotations the step added or removed
+    if not active or holding: return
+
+    result = step()
+    if result == None: return
+
+    added, removed = result
+
+    for item in removed:
+        index.remove(item)
+
+    for item in added:
+        index.insert(item)
+
     update_canvas()
 
-root.bind("<Button>", on_press)
-root.bind("<ButtonRelease>", on_release)
-root.bind('<Motion>', motion)
-root.bind('<Key>', on_key)
+def on_undo(event):
+    change_history(data.undo)
+
+def on_redo(event):
+    change_history(data.redo)
+
+def create_editor():
+    global root
+    global canvas
+
+    root = Tk()
+    root.geometry('721x1020+1+1')
+    # root.geometry('0x0+0+0')
+    root.title("Highlighter")
+    canvas = Canvas(root)
+    canvas.pack()
 
-session_window = Toplevel(root)
-session_window.configure(bg='#262626')
-# 1080 / 2 - 200 / 2
-session_window.geometry('1187x600+723+200')
-# session_window.geometry('0x0+0+0')
-session_window.title("Session Manager")
-# session_canvas = Canvas(session_window)
-# session_canvas.configure(bg='#262626')
-# session_canvas.pack(fill="both", expand=True)
+    root.bind("<Button>", on_press)
+    root.bind("<ButtonRelease>", on_release)
+    root.bind('<Motion>', motion)
+    root.bind('<Key>', on_key)
+    root.bind('<Control-z>', on_undo)
+    root.bind('<Control-y>', on_redo)
+    root.bind('<Control-Z>', on_redo) # Ctrl+Shift+Z
+    root.bind('<MouseWheel>', on_wheel) # Windows and macOS
+    root.bind('<Button-4>', on_wheel) # Linux, wheel scroll up
+    root.bind('<Button-5>', on_wheel) # Linux, wheel scroll down
 
-main_frame = Frame(session_window)
-main_frame.configure(bg='#262626')
-main_frame.pack(fill="both", expand=True)
+    root.protocol('WM_DELETE_WINDOW', on_close)
 
-session_canvas=Canvas(main_frame, bg='#262626')
-session_canvas.pack(side=LEFT, fill="both", expand=True)
+def on_close():
+    # Write every pending edit and sync the store to disk before the window goes away
+    Session.close()
 
-scroll=Scrollbar(main_frame,orient=VERTICAL, command=session_canvas.yview)
-scroll.pack(side=RIGHT,fill=Y)
+    # The prefetch worker may be inside fitz or cv2, it has to finish before the interpreter shuts down
+    if processor != None:
+        processor.close()
 
-session_canvas.configure(yscrollcommand=scroll.set)
-session_canvas.bind('<Configure>', lambda e: session_canvas.configure(scrollregion=session_canvas.bbox('all')))
+    root.destroy()
 
-second_frame = Frame(session_canvas)
-second_frame.configure(bg="#262626")
-# second_frame.pack(fill="both", expand=True)
+def create_session_manager():
+    global session_window
+    global second_frame
 
-# entry = Entry(session_canvas) 
-# session_canvas.create_window((1030, 50), window=entry, anchor='nw')
+    session_window = Toplevel(root)
+    session_window.configure(bg='#262626')
+    # 1080 / 2 - 200 / 2
+    session_window.geometry('1187x600+723+200')
+    # session_window.geometry('0x0+0+0')
+    session_window.title("Session Manager")
+    # session_canvas = Canvas(session_window)
+    # session_canvas.configure(bg='#262626')
+    # session_canvas.pack(fill="both", expand=True)
 
-session_canvas.create_window((0, 0), window=second_frame, anchor='nw')
+    main_frame = Frame(session_window)
+    main_frame.configure(bg='#262626')
+    main_frame.pack(fill="both", expand=True)
+
+    session_canvas=Canvas(main_frame, bg='#262626')
+    session_canvas.pack(side=LEFT, fill="both", expand=True)
+
+    scroll=Scrollbar(main_frame,orient=VERTICAL, command=session_canvas.yview)
+    scroll.pack(side=RIGHT,fill=Y)
+
+    session_canvas.configure(yscrollcommand=scroll.set)
+    session_canvas.bind('<Configure>', lambda e: session_canvas.configure(scrollregion=session_canvas.bbox('all')))
+
+    second_frame = Frame(session_canvas)
+    second_frame.configure(bg="#262626")
+    # second_frame.pack(fill="both", expand=True)
+
+    # entry = Entry(session_canvas) 
+    # session_canvas.create_window((1030, 50), window=entry, anchor='nw')
+
+    session_canvas.create_window((0, 0), window=second_frame, anchor='nw')
 
 def new_session():
+    session_window.destroy()
+
+    open_document(pdf, start_new_session)
+
+def start_new_session():
     global active
     global active_class
     global session
+    global history
+    global data
 
-    session_window.destroy()
-
-    session = Session(pdf)
+    session = Session(pdf, pages=len(images))
+    history = [PageLog() for _ in range(len(images))]
+    data = history[0]
+    index.rebuild(data)
 
     # initialize_sessions()
 
@@ -334,7 +482,7 @@ def new_session():
     active_class = initialize_tool(tools[current_tool]["class"])
 
     update_all()
-    
+
 def fill_frame():
     global enter_session
     global delete_session
@@ -348,22 +496,24 @@ def fill_frame():
     button = Button(second_frame, text ="New session", width=45, font=("Arial", 25), command=new_session)
     button.grid(row=2, column=0)
 
-    # sessions = get_sessions()
-    sessions = Session.get()
+    # Only the manifest is read here, annotation data is loaded when a session is entered
+    sessions = Session.list()
     for i in range(len(sessions)):
         frame = Frame(second_frame, highlightbackground="white", highlightthickness=2, bg="#262626", width=1100, height=80)
         frame.grid(row=4 + i, column=0, pady=10)
 
-        label = Label(frame, text=f'Session {sessions[i]["id"]} - {sessions[i]["file"]}', font=("Arial", 20), bg='#262626', fg='white')
+        _id = sessions[i]["id"]
+
+        label = Label(frame, text=f'Session {_id} - {sessions[i]["file"]} ({log_counts(sessions[i]["counts"])})', font=("Arial", 20), bg='#262626', fg='white')
         label.place(relx=0, rely=0.5, anchor='w', x=10)
 
-        button = Button(frame, text="Enter session", command=lambda i=i: enter_session(i), font=("Arial", 15), width=13)
+        button = Button(frame, text="Enter session", command=lambda _id=_id: enter_session(_id), font=("Arial", 15), width=13)
         button.place(relx=1, rely=0.5, anchor='e', x=-10)
 
-        button = Button(frame, text="Delete session", command=lambda i=i: delete_session(i), font=("Arial", 15), width=13)
+        button = Button(frame, text="Delete session", command=lambda _id=_id: delete_session(_id), font=("Arial", 15), width=13)
         button.place(relx=1, rely=0.5, anchor='e', x=-180)
 
-def enter_session(number):
+def enter_session(_id):
     global active
     global active_class
     global session
@@ -372,20 +522,32 @@ def enter_session(number):
 
     session_window.destroy()
 
-    sessions = Session.get()
-    session = Session(_id=sessions[number]["id"])
+    stored = Session.load(_id)
+
+    # The session's own file is opened, its annotations are placed once the document is ready
+    open_document(stored["file"], lambda: start_stored_session(_id, stored))
+
+def start_stored_session(_id, stored):
+    global active
+    global active_class
+    global session
+    global history
+    global data
+
+    session = Session(file=stored["file"], _id=_id)
 
     active = True
     active_class = initialize_tool(tools[current_tool]["class"])
 
-    history = sessions[number]["data"]
+    history = list(map(PageLog, stored["data"]))
     data = history[0]
+    index.rebuild(data)
     
     update_all()
     update_canvas()
 
-def delete_session(index):
-    Session.delete(index)
+def delete_session(_id):
+    Session.delete(_id)
 
     for widget in second_frame.winfo_children():
         widget.destroy()
@@ -393,29 +555,9 @@ def delete_session(index):
     
     fill_frame()
 
-fill_frame()
-
-
-
-toolbar = Toplevel(root)
-# toolbar.geometry(f'36x{len(list(tools.keys())) * 32 + 4}+0+0')
-toolbar.geometry(f'200x200+0+0')
-toolbar.title("Toolbar")
-
 buttons = []
-
-
 tool_images = []
 
-for i in range(len(list(tools.keys()))):
-    icon = list(tools.values())[i]["icon"]
-    tool_images.append(PhotoImage(file=icon))
-
-for i in range(len(list(tools.keys()))):
-    icon = list(tools.values())[i]["icon"]
-    white_icon = f'.{icon.split(".")[1]}-white.png'
-    tool_images.append(PhotoImage(file=white_icon))
-
 def button_click(button, index):
     global current_tool
 
@@ -437,21 +579,42 @@ def button_click(button, index):
     
     on_tool_change(current_tool)
 
+def create_toolbar():
+    global toolbar
 
+    toolbar = Toplevel(root)
+    # toolbar.geometry(f'36x{len(list(tools.keys())) * 32 + 4}+0+0')
+    toolbar.geometry(f'200x200+0+0')
+    toolbar.title("Toolbar")
 
-for i in range(len(tools.items())):
-    icon = tool_images[i]
+    for i in range(len(list(tools.keys()))):
+        icon = list(tools.values())[i]["icon"]
+        tool_images.append(PhotoImage(file=icon))
 
-    image = Button(toolbar, image=icon, borderwidth=1, relief="solid")
-    image.image = icon  # <== this is were we anchor the img object
-    image.configure(image=icon, command=lambda btn=image, i=i: button_click(btn, i))
-    image.place(anchor='nw', height=32, width=32, y=i*32)
+    for i in range(len(list(tools.keys()))):
+        icon = list(tools.values())[i]["icon"]
+        white_icon = f'.{icon.split(".")[1]}-white.png'
+        tool_images.append(PhotoImage(file=white_icon))
 
-    if current_tool == list(tools.keys())[i]:
-        white_icon = tool_images[i + 4]
-        image.config(bg="black", fg="white", image=white_icon)
+    for i in range(len(tools.items())):
+        icon = tool_images[i]
 
-    buttons.append(image)
+        image = Button(toolbar, image=icon, borderwidth=1, relief="solid")
+        image.image = icon  # <== this is were we anchor the img object
+        image.configure(image=icon, command=lambda btn=image, i=i: button_click(btn, i))
+        image.place(anchor='nw', height=32, width=32, y=i*32)
 
-root.mainloop()
+        if current_tool == list(tools.keys())[i]:
+            white_icon = tool_images[i + 4]
+            image.config(bg="black", fg="white", image=white_icon)
+
+        buttons.append(image)
+
+if __name__ == '__main__':
+    # Only the windows and the session list are created before the main loop, the document is loaded
+    # in the background once a session is chosen
+    create_editor()
+    create_session_manager()
+    fill_frame()
 
+    root.mainloop()
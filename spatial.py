@@ -0,0 +1,85 @@
+import math
+
+# numpy and stroke are imported once there is a page to index, the Session Manager only needs the class
+
+class SpatialIndex:
+    # Uniform grid over the annotations of a page, each annotation is registered in every cell its rectangle
+    # or stroke segments touch, so hit tests only look at the annotations around the pointer
+    def __init__(self, size=32):
+        self.size = size # Cell size in canvas units
+
+        self.cells = {} # (column, row) -> ids of the annotations in it
+        self.items = {} # id -> [annotation, cells, order]
+        self.order = 0 # Increases with every insertion, so results can be returned bottom to top
+
+    def __len__(self):
+        return len(self.items)
+
+    def get_cells(self, info):
+        import numpy as np
+        from stroke import Stroke
+
+        size = self.size
+
+        if isinstance(info, Stroke):
+            segments = info.segments()
+
+            columns = np.floor_divide(np.stack((np.minimum(segments[:, 0], segments[:, 2]), np.maximum(segments[:, 0], segments[:, 2])), axis=1), size).astype(int)
+            rows = np.floor_divide(np.stack((np.minimum(segments[:, 1], segments[:, 3]), np.maximum(segments[:, 1], segments[:, 3])), axis=1), size).astype(int)
+
+            cells = set()
+            for (c0, c1), (r0, r1) in zip(columns.tolist(), rows.tolist()):
+                for column in range(c0, c1 + 1):
+                    for row in range(r0, r1 + 1):
+                        cells.add((column, row))
+
+            return cells
+
+        x0, y0, x1, y1 = info
+
+        return set((column, row)
+                   for column in range(math.floor(min(x0, x1) / size), math.floor(max(x0, x1) / size) + 1)
+                   for row in range(math.floor(min(y0, y1) / size), math.floor(max(y0, y1) / size) + 1))
+
+    def insert(self, item):
+        if item["info"] == None: return
+
+        cells = self.get_cells(item["info"])
+
+        self.items[id(item)] = [item, cells, self.order]
+        self.order += 1
+
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(id(item))
+
+    def remove(self, item):
+        entry = self.items.pop(id(item), None)
+        if entry == None: return
+
+        for cell in entry[1]:
+            ids = self.cells[cell]
+            ids.discard(id(item))
+
+            if len(ids) == 0: del self.cells[cell]
+
+    def rebuild(self, data):
+        self.cells = {}
+        self.items = {}
+        self.order = 0
+
+        for item in data:
+            self.insert(item)
+
+    def query(self, x, y, radius=0, _type=None):
+        # Annotations whose cells are within radius of the point, bottom to top, callers do the exact test
+        size = self.size
+        ids = set()
+
+        for column in range(math.floor((x - radius) / size), math.floor((x + radius) / size) + 1):
+            for row in range(math.floor((y - radius) / size), math.floor((y + radius) / size) + 1):
+                ids.update(self.cells.get((column, row), ()))
+
+        entries = map(lambda e: self.items[e], ids)
+        entries = filter(lambda e: _type == None or e[0]["type"] == _type, entries)
+
+        return list(map(lambda e: e[0], sorted(entries, key=lambda e: e[2])))
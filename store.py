@@ -0,0 +1,399 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from timing import span
+
+# stroke, and numpy with it, is imported by the functions that read or write page data, so listing the sessions
+# in the Session Manager doesn't load it
+
+DATABASE = './sessions.db'
+LEGACY = './sessions.json' # Imported into the database the first time it is created
+AUTOSAVE_INTERVAL = 2.0 # Seconds between background flushes of edited pages
+
+def serialize(data):
+    from stroke import encode
+
+    return json.dumps(data, default=encode)
+
+def count_types(data):
+    counts = {}
+
+    for item in data:
+        counts[item["type"]] = counts.get(item["type"], 0) + 1
+
+    return counts
+
+def merge_counts(counts, other, sign=1):
+    merged = dict(counts)
+
+    for _type, count in other.items():
+        merged[_type] = merged.get(_type, 0) + sign * count
+        if merged[_type] == 0: del merged[_type]
+
+    return merged
+
+class SessionStore:
+    # Sessions live in one table and their annotations in another, one row per (session, page), so saving a
+    # page rewrites that row only instead of the whole history of every session
+    # The sessions table doubles as a manifest: it carries the file, page count, modification time and
+    # annotation counts, so sessions can be listed without reading any annotation data
+    def __init__(self, path=DATABASE, legacy=LEGACY):
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+
+        if version == 0:
+            self.create()
+
+        self.migrate()
+
+        if version == 0 and legacy != None and os.path.exists(legacy):
+            self.import_json(legacy)
+
+    def create(self):
+        with self.lock, self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS sessions (id INTEGER PRIMARY KEY, file TEXT NOT NULL, pages INTEGER NOT NULL)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS pages (session INTEGER NOT NULL, page INTEGER NOT NULL, data TEXT NOT NULL, PRIMARY KEY (session, page)) WITHOUT ROWID')
+            self.connection.execute('PRAGMA user_version = 1')
+
+    def migrate(self):
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+
+        if version < 2:
+            # Version 2 adds the manifest columns, existing sessions are counted once here
+            with self.lock, self.connection:
+                self.connection.execute('ALTER TABLE sessions ADD COLUMN modified REAL NOT NULL DEFAULT 0')
+                self.connection.execute("ALTER TABLE sessions ADD COLUMN counts TEXT NOT NULL DEFAULT '{}'")
+                self.connection.execute("ALTER TABLE pages ADD COLUMN counts TEXT NOT NULL DEFAULT '{}'")
+
+                totals = {}
+                for _id, page, payload in self.connection.execute('SELECT session, page, data FROM pages').fetchall():
+                    counts = count_types(json.loads(payload))
+                    totals[_id] = merge_counts(totals.get(_id, {}), counts)
+
+                    self.connection.execute('UPDATE pages SET counts = ? WHERE session = ? AND page = ?', (json.dumps(counts), _id, page))
+
+                for _id, counts in totals.items():
+                    self.connection.execute('UPDATE sessions SET counts = ? WHERE id = ?', (json.dumps(counts), _id))
+
+                self.connection.execute('UPDATE sessions SET modified = ?', (time.time(),))
+                self.connection.execute('PRAGMA user_version = 2')
+
+        if version < 3:
+            # Version 3 stores pencil strokes as packed float32 points, old segment lists are converted losslessly
+            from stroke import decode_data, is_legacy
+
+            with self.lock, self.connection:
+                for _id, page, payload in self.connection.execute('SELECT session, page, data FROM pages').fetchall():
+                    data = json.loads(payload)
+                    if not is_legacy(data): continue
+
+                    data = decode_data(data)
+                    self.connection.execute('UPDATE pages SET data = ?, counts = ? WHERE session = ? AND page = ?', (serialize(data), json.dumps(count_types(data)), _id, page))
+
+                # Strokes with breaks are split in the conversion, so the session totals are summed again
+                totals = {}
+                for _id, counts in self.connection.execute('SELECT session, counts FROM pages').fetchall():
+                    totals[_id] = merge_counts(totals.get(_id, {}), json.loads(counts))
+
+                for (_id,) in self.connection.execute('SELECT id FROM sessions').fetchall():
+                    self.connection.execute('UPDATE sessions SET counts = ? WHERE id = ?', (json.dumps(totals.get(_id, {})), _id))
+
+                self.connection.execute('PRAGMA user_version = 3')
+
+    def import_json(self, path):
+        from stroke import decode_data
+
+        with open(path, "r") as file:
+            sessions = json.loads(file.read())
+
+        modified = time.time()
+
+        with self.lock, self.connection:
+            for session in sessions:
+                session["data"] = list(map(decode_data, session["data"]))
+
+                # Empty pages have no row, they are filled in as empty lists when the session is read
+                rows = [(session["id"], page, serialize(data), json.dumps(count_types(data))) for page, data in enumerate(session["data"]) if len(data) != 0]
+
+                counts = {}
+                for data in session["data"]:
+                    counts = merge_counts(counts, count_types(data))
+
+                self.connection.execute('INSERT OR REPLACE INTO sessions (id, file, pages, modified, counts) VALUES (?, ?, ?, ?, ?)', (session["id"], session["file"], len(session["data"]), modified, json.dumps(counts)))
+                self.connection.executemany('INSERT OR REPLACE INTO pages (session, page, data, counts) VALUES (?, ?, ?, ?)', rows)
+
+        print(f'Imported {len(sessions)} session(s) from "{path}"')
+
+    def list(self):
+        with self.lock:
+            rows = self.connection.execute('SELECT id, file, pages, modified, counts FROM sessions ORDER BY id').fetchall()
+
+        return list(map(lambda e: { "id": e[0], "file": e[1], "pages": e[2], "modified": e[3], "counts": json.loads(e[4]) }, rows))
+
+    def get(self, _id):
+        with self.lock:
+            session = self.connection.execute('SELECT id, file, pages FROM sessions WHERE id = ?', (_id,)).fetchone()
+            if session == None: return None
+
+            rows = self.connection.execute('SELECT page, data FROM pages WHERE session = ?', (_id,)).fetchall()
+
+        from stroke import decode_data
+
+        data = [[] for _ in range(session[2])]
+        for page, payload in rows:
+            data[page] = decode_data(json.loads(payload))
+
+        return { "id": session[0], "file": session[1], "data": data }
+
+    def get_all(self):
+        return list(map(lambda e: self.get(e["id"]), self.list()))
+
+    def add(self, file, pages):
+        with self.lock, self.connection:
+            _id = self.connection.execute('SELECT COALESCE(MAX(id) + 1, 0) FROM sessions').fetchone()[0]
+            self.connection.execute('INSERT INTO sessions (id, file, pages, modified) VALUES (?, ?, ?, ?)', (_id, file, pages, time.time()))
+
+        return _id
+
+    def delete(self, _id):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM pages WHERE session = ?', (_id,))
+            self.connection.execute('DELETE FROM sessions WHERE id = ?', (_id,))
+
+    def set_page(self, _id, page, data):
+        return self.set_pages([(_id, page, data)]) == 1
+
+    def set_pages(self, rows):
+        # Writes several (session, page, data) records in a single transaction, rows of deleted sessions are skipped
+        # The session's counts are adjusted by the difference between the old and new counts of each page
+        written = 0
+        modified = time.time()
+
+        with self.lock, self.connection:
+            for _id, page, data in rows:
+                session = self.connection.execute('SELECT counts FROM sessions WHERE id = ?', (_id,)).fetchone()
+                if session == None: continue
+
+                previous = self.connection.execute('SELECT counts FROM pages WHERE session = ? AND page = ?', (_id, page)).fetchone()
+                previous = json.loads(previous[0]) if previous != None else {}
+
+                counts = count_types(data)
+                totals = merge_counts(merge_counts(json.loads(session[0]), previous, sign=-1), counts)
+
+                if len(data) == 0:
+                    self.connection.execute('DELETE FROM pages WHERE session = ? AND page = ?', (_id, page))
+                else:
+                    self.connection.execute('INSERT OR REPLACE INTO pages (session, page, data, counts) VALUES (?, ?, ?, ?)', (_id, page, serialize(data), json.dumps(counts)))
+
+                self.connection.execute('UPDATE sessions SET counts = ?, modified = ? WHERE id = ?', (json.dumps(totals), modified, _id))
+                written += 1
+
+        return written
+
+    def simplify(self, tolerance=None):
+        # Simplifies every stored stroke, returns the number of points before and after
+        from stroke import decode_data, simplify, TOLERANCE
+
+        tolerance = tolerance if tolerance != None else TOLERANCE
+        before = 0
+        after = 0
+
+        with self.lock, self.connection:
+            for _id, page, payload in self.connection.execute('SELECT session, page, data FROM pages').fetchall():
+                data = decode_data(json.loads(payload))
+                changed = False
+
+                for item in data:
+                    if item["type"] != "pencil": continue
+
+                    points, _ = simplify(item["info"].points, tolerance)
+
+                    before += len(item["info"])
+                    after += len(points)
+
+                    if len(points) != len(item["info"]):
+                        item["info"].points = points
+                        changed = True
+
+                if changed:
+                    self.connection.execute('UPDATE pages SET data = ? WHERE session = ? AND page = ?', (serialize(data), _id, page))
+
+        return (before, after)
+
+    def sync(self):
+        # Commits in WAL mode with synchronous=NORMAL are not fsynced, a full checkpoint moves them
+        # into the database file and syncs it to disk
+        with self.lock:
+            self.connection.execute('PRAGMA wal_checkpoint(FULL)')
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+class Autosaver:
+    # Edits only mark their page as dirty, a background thread coalesces repeated edits of the same page
+    # and writes the latest state of every dirty page once per interval, or earlier when asked to
+    def __init__(self, store, interval=AUTOSAVE_INTERVAL):
+        self.store = store
+        self.interval = interval
+
+        self.dirty = {} # (session, page) -> data
+        self.lock = threading.Lock()
+        self.flushing = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = False
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def mark(self, _id, page, data):
+        # Only the page is remembered, it is copied when it is written, so an edit costs the same on any page size
+        with self.lock:
+            self.dirty[(_id, page)] = data
+
+    def request_flush(self):
+        # Wakes the writer without waiting for it, used on page changes
+        self.wake.set()
+
+    def flush(self, sync=False):
+        with self.flushing:
+            with self.lock:
+                dirty = self.dirty
+                self.dirty = {}
+
+            if len(dirty) != 0:
+                try:
+                    # A shallow copy is enough, annotations are replaced rather than edited once they are in the page
+                    with span('save', pages=len(dirty)):
+                        self.store.set_pages([(key[0], key[1], list(data)) for key, data in dirty.items()])
+                except Exception as error:
+                    print(f'Failed to save {len(dirty)} page(s): {error}')
+
+                    # Put the pages back unless they were edited again in the meantime
+                    with self.lock:
+                        for key, data in dirty.items():
+                            self.dirty.setdefault(key, data)
+
+                    return False
+
+            if sync:
+                with span('sync'):
+                    self.store.sync()
+
+        return True
+
+    def run(self):
+        while not self.stopped:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+
+            self.flush()
+
+    def close(self):
+        self.stopped = True
+        self.wake.set()
+        self.thread.join()
+
+        self.flush(sync=True)
+
+class Session:
+    store = None # Opened on first use, shared by every session
+    autosaver = None
+
+    @staticmethod
+    def get_store():
+        if Session.store == None:
+            Session.store = SessionStore()
+
+        return Session.store
+
+    @staticmethod
+    def get_autosaver():
+        if Session.autosaver == None:
+            Session.autosaver = Autosaver(Session.get_store())
+
+            # Pending edits are still written if the interpreter exits without the window being closed
+            atexit.register(Session.close)
+
+        return Session.autosaver
+
+    @staticmethod
+    def flush(sync=False, wait=True):
+        # Without waiting, the background writer is only woken up
+        if Session.autosaver == None: return True
+
+        if not wait:
+            Session.autosaver.request_flush()
+            return True
+
+        return Session.autosaver.flush(sync=sync)
+
+    @staticmethod
+    def close():
+        if Session.autosaver != None:
+            Session.autosaver.close()
+            Session.autosaver = None
+
+    @staticmethod
+    def get():
+        return Session.get_store().get_all()
+
+    @staticmethod
+    def list():
+        # Manifest entries only (id, file, pages, modified and annotation counts), no annotation data is read
+        return Session.get_store().list()
+
+    @staticmethod
+    def load(_id):
+        return Session.get_store().get(_id)
+
+    @staticmethod
+    def delete(_id):
+        Session.get_store().delete(_id)
+    
+    def __init__(self, file=None, _id=None, pages=None):
+        # New sessions are given the page count of their file, the store does not open documents itself
+        self.file = file
+
+        if _id != None:
+            self.id = _id
+            return
+
+        self.id = Session.get_store().add(file, pages)
+
+        print(f'Initialized session "{self.id}" on file "{file}" with {pages} page(s)')
+            
+    def change_data(self, page, data):
+        # The page is only marked as dirty here, the autosaver writes its row in the background
+        Session.get_autosaver().mark(self.id, page, data)
+
+if __name__ == '__main__':
+    import argparse
+    from stroke import TOLERANCE
+
+    parser = argparse.ArgumentParser(description='Maintenance of the session store')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('simplify', help='simplify every stored pencil stroke')
+    command.add_argument('--tolerance', type=float, default=TOLERANCE, help='furthest a removed point may be from the stroke, in page units')
+
+    arguments = parser.parse_args()
+
+    store = SessionStore()
+
+    if arguments.command == 'simplify':
+        before, after = store.simplify(arguments.tolerance)
+        print(f'Simplified {before} point(s) to {after} ({after / max(before, 1):.0%} kept)')
+
+    store.sync()
+    store.close()
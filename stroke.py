@@ -0,0 +1,145 @@
+import base64
+import math
+import numpy as np
+
+TOLERANCE = 1.0 # Furthest a removed point may be from the simplified stroke, in page (fitted canvas) units
+
+class Stroke:
+    # A pencil stroke kept as one contiguous (n, 2) float32 buffer of points plus per-stroke flags
+    # Segment i runs from point i to point i + 1, so every point is stored once instead of twice
+    BLURRED = 1 # Marked by the eraser, drawn red until it is removed
+
+    def __init__(self, points, flags=0):
+        self.points = np.ascontiguousarray(points, dtype=np.float32).reshape(-1, 2)
+        self.flags = flags
+
+    def __len__(self):
+        return len(self.points)
+
+    def is_blurred(self):
+        return self.flags & Stroke.BLURRED != 0
+
+    def segments(self):
+        # (n - 1, 4) array of x0, y0, x1, y1, a single point is a segment of zero length
+        if len(self.points) == 1:
+            return np.hstack((self.points, self.points))
+
+        return np.hstack((self.points[:-1], self.points[1:]))
+
+    def near(self, x, y, offset):
+        # A point is near a segment when it lies inside the ellipse around it whose foci are the segment ends,
+        # the sum of the distances to both ends may be at most 2 * sqrt(offset^2 + (length / 2)^2)
+        segments = self.segments()
+
+        length = np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1])
+        maximum = 2 * np.sqrt(offset**2 + (length / 2)**2)
+        distance = np.hypot(x - segments[:, 0], y - segments[:, 1]) + np.hypot(x - segments[:, 2], y - segments[:, 3])
+
+        return bool(np.any(distance <= maximum))
+
+    def to_json(self):
+        # Little endian float32 bytes packed as base64, about a third of the size of the old segment lists
+        data = self.points.astype('<f4').tobytes()
+
+        return { "points": base64.b64encode(data).decode('ascii'), "flags": self.flags }
+
+    @staticmethod
+    def from_json(info):
+        data = base64.b64decode(info["points"])
+
+        return Stroke(np.frombuffer(data, dtype='<f4'), info["flags"])
+
+    @staticmethod
+    def from_segments(segments):
+        # Converts the old [[x0, y0, x1, y1, alpha], ...] format, the recorded segments always continue
+        # from where the previous one ended, any break in the chain starts a new stroke so nothing is lost
+        strokes = []
+        points = []
+        blurred = False
+
+        for x0, y0, x1, y1, alpha in segments:
+            if len(points) != 0 and points[-1] != [x0, y0]:
+                strokes.append(Stroke(points, Stroke.BLURRED if blurred else 0))
+                points = []
+                blurred = False
+
+            if len(points) == 0:
+                points.append([x0, y0])
+
+            points.append([x1, y1])
+            blurred = blurred or alpha == 0
+
+        if len(points) != 0:
+            strokes.append(Stroke(points, Stroke.BLURRED if blurred else 0))
+
+        return strokes
+
+def simplify(points, tolerance=TOLERANCE):
+    # Ramer-Douglas-Peucker, a point is kept when it is further than the tolerance from the line between the
+    # points kept around it, each split measures all of its points at once
+    # Returns the kept points and the fraction of the original points they make up
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+    count = len(points)
+
+    if count < 3: return points, 1.0
+
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = True
+    keep[-1] = True
+
+    coordinates = points.astype(np.float64)
+    stack = [(0, count - 1)]
+
+    while len(stack) != 0:
+        start, end = stack.pop()
+        if end - start < 2: continue
+
+        origin = coordinates[start]
+        direction = coordinates[end] - origin
+        inner = coordinates[start + 1:end] - origin
+
+        length = math.hypot(direction[0], direction[1])
+
+        # A closed loop has no line to measure against, the distance to its end point is used instead
+        if length == 0:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distances = np.abs(direction[0] * inner[:, 1] - direction[1] * inner[:, 0]) / length
+
+        furthest = int(np.argmax(distances))
+
+        if distances[furthest] > tolerance:
+            split = start + 1 + furthest
+            keep[split] = True
+
+            stack.append((start, split))
+            stack.append((split, end))
+
+    simplified = points[keep]
+
+    return simplified, len(simplified) / count
+
+def is_legacy(data):
+    return any(map(lambda e: e["type"] == "pencil" and isinstance(e["info"], list), data))
+
+def decode_data(data):
+    # Turns the annotations of a page as stored into the in-memory representation
+    decoded = []
+
+    for item in data:
+        if item["type"] != "pencil":
+            decoded.append(item)
+        elif isinstance(item["info"], list):
+            for stroke in Stroke.from_segments(item["info"]):
+                decoded.append({ "type": "pencil", "info": stroke })
+        else:
+            decoded.append({ "type": "pencil", "info": Stroke.from_json(item["info"]) })
+
+    return decoded
+
+def encode(item):
+    # json.dumps default for the objects annotations carry
+    if isinstance(item, Stroke):
+        return item.to_json()
+
+    raise TypeError(f'Object of type {type(item).__name__} is not JSON serializable')
@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import atexit
+import threading
+
+# Named spans around the expensive steps of the editor, recorded only when tracing is enabled, either with
+# the PDF_EDITOR_TRACE environment variable set to the output path or by calling enable()
+# While disabled, span() returns a shared object whose enter and exit do nothing
+# On exit the spans are written as a Chrome trace (chrome://tracing or ui.perfetto.dev) and summed up in a table
+
+ENVIRONMENT = 'PDF_EDITOR_TRACE'
+
+enabled = False
+path = None
+owner = None # Process that enabled tracing, forked export workers inherit the flag but never write the trace
+events = [] # (name, start, end, process, thread, args), times in perf_counter nanoseconds
+
+class Span:
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exception):
+        events.append((self.name, self.start, time.perf_counter_ns(), os.getpid(), threading.get_ident(), self.args))
+
+    def set(self, **args):
+        # Arguments only known once the traced step is done, such as the size of its result
+        self.args.update(args)
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        pass
+
+    def set(self, **args):
+        pass
+
+NULL = NullSpan()
+
+def span(name, **args):
+    if not enabled: return NULL
+
+    return Span(name, args)
+
+def enable(output='trace.json'):
+    global enabled
+    global path
+    global owner
+
+    if not enabled:
+        atexit.register(write)
+
+    enabled = True
+    path = output
+    owner = os.getpid()
+
+def collect():
+    # Takes the events recorded so far, export workers send theirs back with every page they render
+    recorded = events[:]
+    del events[:len(recorded)]
+
+    return recorded
+
+def merge(recorded):
+    # Events of a worker process, its pid keeps them apart from the events of this process in the trace
+    events.extend(recorded)
+
+def summary():
+    # name -> [count, total, maximum] in nanoseconds, in order of first appearance
+    totals = {}
+
+    for name, start, end, _, _, _ in events:
+        entry = totals.setdefault(name, [0, 0, 0])
+        entry[0] += 1
+        entry[1] += end - start
+        entry[2] = max(entry[2], end - start)
+
+    return totals
+
+def write():
+    if not enabled or os.getpid() != owner or len(events) == 0: return
+
+    trace = [{ "name": name, "ph": "X", "ts": start / 1000, "dur": (end - start) / 1000, "pid": pid, "tid": thread, "args": args }
+             for name, start, end, pid, thread, args in list(events)]
+
+    with open(path, "w") as file:
+        file.write(json.dumps({ "traceEvents": trace, "displayTimeUnit": "ms" }))
+
+    print(f'{"span":<24} {"count":>7} {"total ms":>11} {"mean ms":>10} {"max ms":>10}')
+    for name, (count, total, maximum) in summary().items():
+        print(f'{name:<24} {count:>7} {total / 1e6:>11.2f} {total / count / 1e6:>10.3f} {maximum / 1e6:>10.3f}')
+
+    print(f'Wrote {len(trace)} span(s) to "{path}"')
+
+if os.environ.get(ENVIRONMENT):
+    enable(os.environ[ENVIRONMENT])
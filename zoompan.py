@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+# Advanced zoom for images of various types from small to huge up to several GB
+# CanvasImage is the standalone viewer used by zoompan-test.py, PageView shows editor pages through the same pyramid
+import hashlib
+import math
+import os
+import shutil
+import threading
+import warnings
+import numpy as np
+import tkinter as tk
+
+from tkinter import ttk
+from PIL import Image, ImageTk
+
+from timing import span
+from filecache import atomic_save, evict
+
+PYRAMID_CACHE = './.cache/pyramid'  # pyramid levels of opened images, keyed by path, size and modification time
+PYRAMID_BUDGET = 2 * 1024 * 1024 * 1024  # bytes of cached levels, the least recently opened images are deleted first
+
+def pyramid_sizes(w, h, reduction=2, size=512):
+    """ Sizes of the pyramid levels of a w x h image, the top image is around size pixels """
+    sizes = [(int(w), int(h))]
+    while w > size and h > size:  # top pyramid image is around 512 pixels in size
+        w /= reduction  # divide on reduction degree
+        h /= reduction  # divide on reduction degree
+        sizes.append((int(w), int(h)))
+    return sizes
+
+def pyramid_entries():
+    """ (last use, size, directory, source) of every cached pyramid. A complete pyramid names its source image
+        in its 'complete' marker, which is touched whenever the pyramid is loaded """
+    entries = []
+    if not os.path.isdir(PYRAMID_CACHE):
+        return entries
+    for name in os.listdir(PYRAMID_CACHE):
+        directory = os.path.join(PYRAMID_CACHE, name)
+        marker = os.path.join(directory, 'complete')
+        try:
+            size = sum(map(lambda e: os.path.getsize(os.path.join(directory, e)), os.listdir(directory)))
+            if os.path.exists(marker):
+                with open(marker, 'r') as file:
+                    source = file.read()
+                used = os.stat(marker).st_mtime_ns
+            else:  # still being built, or abandoned by a build that failed
+                source = None
+                used = os.stat(directory).st_mtime_ns
+        except OSError:  # removed by another process meanwhile
+            continue
+        entries.append((used, size, directory, source))
+    return entries
+
+def prune_pyramids(current, source, budget=PYRAMID_BUDGET):
+    """ Delete the pyramids of earlier versions of the source image, which can never be loaded again,
+        then the least recently used pyramids until the cache fits into the budget """
+    entries = []
+    for used, size, directory, other in pyramid_entries():
+        if other == source and directory != current:
+            shutil.rmtree(directory, ignore_errors=True)
+        else:
+            entries.append((used, size, directory))
+    evict(entries, budget, shutil.rmtree)
+
+def build_pyramid(pyramid, reduction=2, resample=Image.LANCZOS, size=512):
+    """ Append smaller images to the pyramid until its top image is around size pixels """
+    for wh in pyramid_sizes(*pyramid[-1].size, reduction, size)[1:]:
+        pyramid.append(pyramid[-1].resize(wh, resample))
+    return pyramid
+
+class AutoScrollbar(ttk.Scrollbar):
+    """ A scrollbar that hides itself if it's not needed. Works only for grid geometry manager """
+    def set(self, lo, hi):
+        if float(lo) <= 0.0 and float(hi) >= 1.0:
+            self.grid_remove()
+        else:
+            self.grid()
+            ttk.Scrollbar.set(self, lo, hi)
+
+    def pack(self, **kw):
+        raise tk.TclError('Cannot use pack with the widget ' + self.__class__.__name__)
+
+    def place(self, **kw):
+        raise tk.TclError('Cannot use place with the widget ' + self.__class__.__name__)
+
+class CanvasImage:
+    """ Display and zoom image """
+    def __init__(self, canvas, placeholder, path):
+        """ Initialize the ImageFrame """
+        self.imscale = 1.0  # scale for the canvas image zoom, public for outer classes
+        self.__delta = 1.3  # zoom magnitude
+        self.__filter = Image.LANCZOS  # could be: NEAREST, BILINEAR, BICUBIC and LANCZOS (formerly ANTIALIAS)
+        self.__previous_state = 0  # previous state of the keyboard
+        self.path = path  # path to the image, should be public for outer classes
+        # Create ImageFrame in placeholder widget
+        self.__imframe = ttk.Frame(placeholder)  # placeholder of the ImageFrame object
+        # Vertical and horizontal scrollbars for canvas
+        hbar = AutoScrollbar(self.__imframe, orient='horizontal')
+        vbar = AutoScrollbar(self.__imframe, orient='vertical')
+        hbar.grid(row=1, column=0, sticky='we')
+        vbar.grid(row=0, column=1, sticky='ns')
+        # Create canvas and bind it with scrollbars. Public for outer classes
+
+        self.canvas = canvas
+        self.canvas.configure(highlightthickness=0,
+                                xscrollcommand=hbar.set, yscrollcommand=vbar.set)
+        # self.canvas = tk.Canvas(self.__imframe, highlightthickness=0,
+                                # xscrollcommand=hbar.set, yscrollcommand=vbar.set)
+        self.canvas.grid(row=0, column=0, sticky='nswe')
+        self.canvas.update()  # wait till canvas is created
+        hbar.configure(command=self.__scroll_x)  # bind scrollbars to the canvas
+        vbar.configure(command=self.__scroll_y)
+        # Bind events to the Canvas
+        self.canvas.bind('<Configure>', lambda event: self.__show_image())  # canvas is resized
+        self.canvas.bind('<ButtonPress-1>', self.__move_from)  # remember canvas position
+        self.canvas.bind('<B1-Motion>',     self.__move_to)  # move canvas to the new position
+        self.canvas.bind('<MouseWheel>', self.__wheel)  # zoom for Windows and MacOS, but not Linux
+        self.canvas.bind('<Button-5>',   self.__wheel)  # zoom for Linux, wheel scroll down
+        self.canvas.bind('<Button-4>',   self.__wheel)  # zoom for Linux, wheel scroll up
+        # Handle keystrokes in idle mode, because program slows down on a weak computers,
+        # when too many key stroke events in the same time
+        self.canvas.bind('<Key>', lambda event: self.canvas.after_idle(self.__keystroke, event))
+        # Decide if this image huge or not
+        self.__huge = False  # huge or not
+        self.__huge_size = 14000  # define size of the huge image
+        self.__band_width = 1024  # width of the tile band
+        Image.MAX_IMAGE_PIXELS = 1000000000  # suppress DecompressionBombError for the big image
+        with warnings.catch_warnings():  # suppress DecompressionBombWarning
+            warnings.simplefilter('ignore')
+            self.__image = Image.open(self.path)  # open image, but down't load it
+        self.imwidth, self.imheight = self.__image.size  # public for outer classes
+        if self.imwidth * self.imheight > self.__huge_size * self.__huge_size and \
+           self.__image.tile[0][0] == 'raw':  # only raw images could be tiled
+            self.__huge = True  # image is huge
+            self.__offset = self.__image.tile[0][2]  # initial tile offset
+            self.__tile = [self.__image.tile[0][0],  # it have to be 'raw'
+                           [0, 0, self.imwidth, 0],  # tile extent (a rectangle)
+                           self.__offset,
+                           self.__image.tile[0][3]]  # list of arguments to the decoder
+        self.__min_side = min(self.imwidth, self.imheight)  # get the smaller image side
+        # Set ratio coefficient for image pyramid
+        self.__ratio = max(self.imwidth, self.imheight) / self.__huge_size if self.__huge else 1.0
+        self.__curr_img = 0  # current image from the pyramid
+        self.__reduction = 2  # reduction degree of image pyramid
+        # Create image pyramid. Its levels are filled in by a worker thread, loaded from the cache or built,
+        # missing levels are None and the closest existing level is shown meanwhile
+        base = self.__smaller_geometry()[0] if self.__huge else (self.imwidth, self.imheight)
+        self.__pyramid = [None] * len(pyramid_sizes(*base, self.__reduction))
+        if not self.__huge:
+            self.__pyramid[0] = Image.open(self.path)  # the image itself is the first level
+        self.__shown = 0  # number of pyramid levels that existed when the image was last shown
+        self.__worker = threading.Thread(target=self.__build, daemon=True)
+        self.__worker.start()
+        # Put image into container rectangle and use it to set proper coordinates to the image
+        self.container = self.canvas.create_rectangle((0, 0, self.imwidth, self.imheight), width=0)
+        self.__show_image()  # show image on the canvas
+        self.canvas.focus_set()  # set focus on the canvas
+        self.canvas.after(100, self.__poll)  # show new pyramid levels as they appear
+
+    def __cache_path(self):
+        """ Cache directory of the pyramid, keyed by the path, size and modification time of the image,
+            and the source it is recorded under, the same for every version of the image """
+        stat = os.stat(self.path)
+        source = '{path}:{huge}:{reduction}'.format(path=os.path.abspath(self.path), huge=self.__huge_size,
+                                                    reduction=self.__reduction)
+        key = '{source}:{size}:{mtime}'.format(source=source, size=stat.st_size, mtime=stat.st_mtime_ns)
+        return os.path.join(PYRAMID_CACHE, hashlib.sha1(key.encode()).hexdigest()), source
+
+    def __build(self):
+        """ Fill in the pyramid in the background. Cached levels are loaded coarsest first,
+            otherwise the levels are built and written to the cache one by one """
+        try:
+            path, source = self.__cache_path()
+            first = 0 if self.__huge else 1  # the first level of a normal image is the file itself
+            if os.path.exists(os.path.join(path, 'complete')):
+                os.utime(os.path.join(path, 'complete'))  # mark as recently used
+                for i in reversed(range(first, len(self.__pyramid))):
+                    self.__pyramid[i] = Image.fromarray(np.load(os.path.join(path, '{i}.npy'.format(i=i))))
+                return
+            if self.__huge:
+                image = self.smaller()
+            else:
+                with warnings.catch_warnings():  # suppress DecompressionBombWarning
+                    warnings.simplefilter('ignore')
+                    image = Image.open(self.path)  # own handle, the one in the pyramid is used by the Tk thread
+            cache = image.mode in ['L', 'RGB', 'RGBA']  # modes that survive the round trip through numpy
+            if cache:
+                os.makedirs(path, exist_ok=True)
+            sizes = pyramid_sizes(*image.size, self.__reduction)
+            for i in range(len(sizes)):
+                if i != 0:
+                    image = image.resize(sizes[i], self.__filter)
+                if i >= first:
+                    self.__pyramid[i] = image
+                    if cache:
+                        self.__save(path, i, image)
+            if cache:
+                atomic_save(os.path.join(path, 'complete'), lambda file: file.write(source), mode='w')
+                prune_pyramids(path, source)
+        except Exception as error:
+            print('Failed to build the image pyramid: {error}'.format(error=error))
+
+    def __save(self, path, i, image):
+        """ Write a pyramid level to the cache """
+        atomic_save(os.path.join(path, '{i}.npy'.format(i=i)), lambda file: np.save(file, np.asarray(image)))
+
+    def __poll(self):
+        """ Redraw when the worker has added pyramid levels, until it is done """
+        alive = self.__worker.is_alive()
+        available = len(self.__pyramid) - self.__pyramid.count(None)
+        if available != self.__shown:
+            self.__show_image()
+        if alive:
+            self.canvas.after(100, self.__poll)
+
+    def __level(self):
+        """ Existing pyramid level closest to the current one, finer levels are preferred """
+        wanted = max(0, self.__curr_img)
+        available = [i for i, image in enumerate(self.__pyramid) if image is not None]
+        if len(available) == 0: return None
+        finer = [i for i in available if i <= wanted]
+        return max(finer) if len(finer) != 0 else min(available)
+
+    def __smaller_geometry(self):
+        """ Size of the image made by smaller(), its compression ratio and band length """
+        w1, h1 = float(self.imwidth), float(self.imheight)
+        w2, h2 = float(self.__huge_size), float(self.__huge_size)
+        aspect_ratio1 = w1 / h1
+        aspect_ratio2 = w2 / h2  # it equals to 1.0
+        if aspect_ratio1 == aspect_ratio2:
+            return (int(w2), int(h2)), h2 / h1, int(w2)
+        elif aspect_ratio1 > aspect_ratio2:
+            return (int(w2), int(w2 / aspect_ratio1)), h2 / w1, int(w2)
+        else:  # aspect_ratio1 < aspect_ration2
+            return (int(h2 * aspect_ratio1), int(h2)), h2 / h1, int(h2 * aspect_ratio1)
+
+    def smaller(self):
+        """ Resize image proportionally and return smaller image.
+            Uses its own image handle and tile, so it can run while the Tk thread reads the huge image """
+        size, k, w = self.__smaller_geometry()
+        image = Image.new('RGB', size)
+        tile = [self.__tile[0], list(self.__tile[1]), self.__tile[2], self.__tile[3]]
+        i, j, n = 0, 1, round(0.5 + self.imheight / self.__band_width)
+        while i < self.imheight:
+            print('\rOpening image: {j} from {n}'.format(j=j, n=n), end='')
+            band = min(self.__band_width, self.imheight - i)  # width of the tile band
+            tile[1][3] = band  # set band width
+            tile[2] = self.__offset + self.imwidth * i * 3  # tile offset (3 bytes per pixel)
+            source = Image.open(self.path)  # reopen / reset image
+            source.size = (self.imwidth, band)  # set size of the tile band
+            source.tile = [tile]  # set tile
+            cropped = source.crop((0, 0, self.imwidth, band))  # crop tile band
+            source.close()
+            image.paste(cropped.resize((w, int(band * k)+1), self.__filter), (0, int(i * k)))
+            i += band
+            j += 1
+        print('\r' + 30*' ' + '\r', end='')  # hide printed string
+        return image
+
+    def redraw_figures(self):
+        """ Dummy function to redraw figures in the children classes """
+        pass
+
+    def grid(self, **kw):
+        """ Put CanvasImage widget on the parent widget """
+        self.__imframe.grid(**kw)  # place CanvasImage widget on the grid
+        self.__imframe.grid(sticky='nswe')  # make frame container sticky
+        self.__imframe.rowconfigure(0, weight=1)  # make canvas expandable
+        self.__imframe.columnconfigure(0, weight=1)
+
+    def pack(self, **kw):
+        """ Exception: cannot use pack with this widget """
+        raise Exception('Cannot use pack with the widget ' + self.__class__.__name__)
+
+    def place(self, **kw):
+        """ Exception: cannot use place with this widget """
+        raise Exception('Cannot use place with the widget ' + self.__class__.__name__)
+
+    # noinspection PyUnusedLocal
+    def __scroll_x(self, *args, **kwargs):
+        """ Scroll canvas horizontally and redraw the image """
+        self.canvas.xview(*args)  # scroll horizontally
+        self.__show_image()  # redraw the image
+
+    # noinspection PyUnusedLocal
+    def __scroll_y(self, *args, **kwargs):
+        """ Scroll canvas vertically and redraw the image """
+        self.canvas.yview(*args)  # scroll vertically
+        self.__show_image()  # redraw the image
+
+    def __show_image(self):
+        """ Show image on the Canvas. Implements correct image zoom almost like in Google Maps """
+        box_image = self.canvas.coords(self.container)  # get image area
+        box_canvas = (self.canvas.canvasx(0),  # get visible area of the canvas
+                      self.canvas.canvasy(0),
+                      self.canvas.canvasx(self.canvas.winfo_width()),
+                      self.canvas.canvasy(self.canvas.winfo_height()))
+        box_img_int = tuple(map(int, box_image))  # convert to integer or it will not work properly
+        # Get scroll region box
+        box_scroll = [min(box_img_int[0], box_canvas[0]), min(box_img_int[1], box_canvas[1]),
+                      max(box_img_int[2], box_canvas[2]), max(box_img_int[3], box_canvas[3])]
+        # Horizontal part of the image is in the visible area
+        if  box_scroll[0] == box_canvas[0] and box_scroll[2] == box_canvas[2]:
+            box_scroll[0]  = box_img_int[0]
+            box_scroll[2]  = box_img_int[2]
+        # Vertical part of the image is in the visible area
+        if  box_scroll[1] == box_canvas[1] and box_scroll[3] == box_canvas[3]:
+            box_scroll[1]  = box_img_int[1]
+            box_scroll[3]  = box_img_int[3]
+        # Convert scroll region to tuple and to integer
+        self.canvas.configure(scrollregion=tuple(map(int, box_scroll)))  # set scroll region
+        x1 = max(box_canvas[0] - box_image[0], 0)  # get coordinates (x1,y1,x2,y2) of the image tile
+        y1 = max(box_canvas[1] - box_image[1], 0)
+        x2 = min(box_canvas[2], box_image[2]) - box_image[0]
+        y2 = min(box_canvas[3], box_image[3]) - box_image[1]
+        if int(x2 - x1) > 0 and int(y2 - y1) > 0:  # show image if it in the visible area
+            if self.__huge and self.__curr_img < 0:  # show huge image
+                h = int((y2 - y1) / self.imscale)  # height of the tile band
+                self.__tile[1][3] = h  # set the tile band height
+                self.__tile[2] = self.__offset + self.imwidth * int(y1 / self.imscale) * 3
+                self.__image.close()
+                self.__image = Image.open(self.path)  # reopen / reset image
+                self.__image.size = (self.imwidth, h)  # set size of the tile band
+                self.__image.tile = [self.__tile]
+                image = self.__image.crop((int(x1 / self.imscale), 0, int(x2 / self.imscale), h))
+            else:  # show normal image
+                level = self.__level()
+                if level is None: return  # nothing to show until the first pyramid level exists
+                self.__shown = len(self.__pyramid) - self.__pyramid.count(None)
+                scale = self.imscale * self.__ratio * math.pow(self.__reduction, level)  # image pyramid scale
+                image = self.__pyramid[level].crop(  # crop current img from pyramid
+                                    (int(x1 / scale), int(y1 / scale),
+                                     int(x2 / scale), int(y2 / scale)))
+            #
+            imagetk = ImageTk.PhotoImage(image.resize((int(x2 - x1), int(y2 - y1)), self.__filter))
+            imageid = self.canvas.create_image(max(box_canvas[0], box_img_int[0]),
+                                               max(box_canvas[1], box_img_int[1]),
+                                               anchor='nw', image=imagetk)
+            self.canvas.lower(imageid)  # set image into background
+            self.canvas.imagetk = imagetk  # keep an extra reference to prevent garbage-collection
+
+    def __move_from(self, event):
+        """ Remember previous coordinates for scrolling with the mouse """
+        self.canvas.scan_mark(event.x, event.y)
+
+    def __move_to(self, event):
+        """ Drag (move) canvas to the new position """
+        self.canvas.scan_dragto(event.x, event.y, gain=1)
+        self.__show_image()  # zoom tile and show it on the canvas
+
+    def outside(self, x, y):
+        """ Checks if the point (x,y) is outside the image area """
+        bbox = self.canvas.coords(self.container)  # get image area
+        if bbox[0] < x < bbox[2] and bbox[1] < y < bbox[3]:
+            return False  # point (x,y) is inside the image area
+        else:
+            return True  # point (x,y) is outside the image area
+
+    def __wheel(self, event):
+        """ Zoom with mouse wheel """
+        x = self.canvas.canvasx(event.x)  # get coordinates of the event on the canvas
+        y = self.canvas.canvasy(event.y)
+        if self.outside(x, y): return  # zoom only inside image area
+        scale = 1.0
+        # Respond to Linux (event.num) or Windows (event.delta) wheel event
+        if event.num == 5 or event.delta == -120:  # scroll down, smaller
+            if round(self.__min_side * self.imscale) < 30: return  # image is less than 30 pixels
+            self.imscale /= self.__delta
+            scale        /= self.__delta
+        if event.num == 4 or event.delta == 120:  # scroll up, bigger
+            i = min(self.canvas.winfo_width(), self.canvas.winfo_height()) >> 1
+            if i < self.imscale: return  # 1 pixel is bigger than the visible area
+            self.imscale *= self.__delta
+            scale        *= self.__delta
+        # Take appropriate image from the pyramid
+        k = self.imscale * self.__ratio  # temporary coefficient
+        self.__curr_img = min((-1) * int(math.log(k, self.__reduction)), len(self.__pyramid) - 1)
+        #
+        self.canvas.scale('all', x, y, scale, scale)  # rescale all objects
+        # Redraw some figures before showing image on the screen
+        self.redraw_figures()  # method for child classes
+        self.__show_image()
+
+    def __keystroke(self, event):
+        """ Scrolling with the keyboard.
+            Independent from the language of the keyboard, CapsLock, <Ctrl>+<key>, etc. """
+        if event.state - self.__previous_state == 4:  # means that the Control key is pressed
+            pass  # do nothing if Control key is pressed
+        else:
+            self.__previous_state = event.state  # remember the last keystroke state
+            # Up, Down, Left, Right keystrokes
+            if event.keycode in [68, 39, 102]:  # scroll right: keys 'D', 'Right' or 'Numpad-6'
+                self.__scroll_x('scroll',  1, 'unit', event=event)
+            elif event.keycode in [65, 37, 100]:  # scroll left: keys 'A', 'Left' or 'Numpad-4'
+                self.__scroll_x('scroll', -1, 'unit', event=event)
+            elif event.keycode in [87, 38, 104]:  # scroll up: keys 'W', 'Up' or 'Numpad-8'
+                self.__scroll_y('scroll', -1, 'unit', event=event)
+            elif event.keycode in [83, 40, 98]:  # scroll down: keys 'S', 'Down' or 'Numpad-2'
+                self.__scroll_y('scroll',  1, 'unit', event=event)
+
+    def crop(self, bbox):
+        """ Crop rectangle from the image and return it """
+        if self.__huge:  # image is huge and not totally in RAM
+            band = bbox[3] - bbox[1]  # width of the tile band
+            self.__tile[1][3] = band  # set the tile height
+            self.__tile[2] = self.__offset + self.imwidth * bbox[1] * 3  # set offset of the band
+            self.__image.close()
+            self.__image = Image.open(self.path)  # reopen / reset image
+            self.__image.size = (self.imwidth, band)  # set size of the tile band
+            self.__image.tile = [self.__tile]
+            return self.__image.crop((bbox[0], 0, bbox[2], band))
+        else:  # image is totally in RAM
+            return self.__pyramid[0].crop(bbox)
+
+    def destroy(self):
+        """ ImageFrame destructor """
+        self.__image.close()
+        map(lambda i: i.close, self.__pyramid)  # close all pyramid images
+        del self.__pyramid[:]  # delete pyramid list
+        del self.__pyramid  # delete pyramid variable
+        self.canvas.destroy()
+        self.__imframe.destroy()
+
+class PageView:
+    """ Show an editor page through an image pyramid, only the visible part of the page is resampled """
+    def __init__(self, canvas, view):
+        """ Initialize the PageView, view maps page units to canvas coordinates """
+        self.canvas = canvas
+        self.view = view
+        self.__reduction = 2  # reduction degree of image pyramid
+        self.__filter = Image.LANCZOS
+        self.__pyramid = []
+        self.__base = 1.0  # page units per pixel of the full resolution image
+        self.imagetk = None  # keep a reference to prevent garbage-collection
+
+    def set_image(self, image, base):
+        """ Build the pyramid of a BGRA page image, base scales its pixels to page units """
+        (height, width, _) = image.shape
+        with span('build_pyramid', width=width, height=height):
+            self.__pyramid = build_pyramid([Image.frombuffer('RGBA', (width, height), image, 'raw', 'BGRA', 0, 1)],
+                                           self.__reduction, self.__filter)
+        self.__base = base
+
+    def render(self):
+        """ Crop the visible area from the closest pyramid level and resize it to the viewport,
+            returns the image with its canvas position, or None if the page is outside the viewport """
+        if len(self.__pyramid) == 0: return None
+        width, height = int(self.canvas.cget('width')), int(self.canvas.cget('height'))
+        scale = self.__base * self.view.zoom  # canvas pixels per pixel of the full resolution image
+        left, top = self.view.to_canvas(0, 0)
+        w, h = self.__pyramid[0].size
+        x1, y1 = max(left, 0), max(top, 0)  # visible area of the page in canvas coordinates
+        x2, y2 = min(left + w * scale, width), min(top + h * scale, height)
+        if int(x2 - x1) <= 0 or int(y2 - y1) <= 0: return None  # page is outside the visible area
+        # Take appropriate image from the pyramid, the same way CanvasImage does when zooming
+        level = min(max(0, (-1) * int(math.log(scale, self.__reduction))), len(self.__pyramid) - 1)
+        k = scale * math.pow(self.__reduction, level)  # canvas pixels per pixel of the pyramid level
+        with span('resample', level=level):
+            image = self.__pyramid[level].crop((int((x1 - left) / k), int((y1 - top) / k),
+                                                int((x2 - left) / k), int((y2 - top) / k)))
+            image = image.resize((int(x2 - x1), int(y2 - y1)), self.__filter)
+        with span('photoimage'):
+            self.imagetk = ImageTk.PhotoImage(image)
+        return (self.imagetk, int(x1), int(y1))
+